@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional, Tuple
+
+import metrics
+
+ArpTables = Tuple[Dict[str, str], Dict[str, str]]
+
+
+def parse_arp_scan(output: str) -> ArpTables:
+    """Parse arp-scan output into IP->MAC and MAC->Vendor mappings."""
+    arp_table = {}
+    vendor_table = {}
+    for line in output.split('\n'):
+        if not line.strip():
+            continue
+        # arp-scan output: IP MAC [Vendor]
+        parts = line.strip().split()
+        if len(parts) >= 3:
+            ip = parts[0]
+            mac = parts[1]
+            vendor = ' '.join(parts[2:])
+            arp_table[ip] = mac
+            vendor_table[mac] = vendor[:20]  # Limit vendor to 20 chars
+            logging.debug("Found vendor for %s: %s", mac, vendor_table[mac])
+        elif len(parts) == 2:
+            ip = parts[0]
+            mac = parts[1]
+            arp_table[ip] = mac
+    return arp_table, vendor_table
+
+
+async def run_arp_scan(timeout: float = 10.0) -> ArpTables:
+    """Run ``arp-scan --localnet`` without blocking the event loop."""
+    started = time.perf_counter()
+    try:
+        output = await _arp_scan_output(timeout)
+    except BaseException:
+        metrics.arp_scan_seconds.labels('error').observe(time.perf_counter() - started)
+        raise
+    metrics.arp_scan_seconds.labels('ok').observe(time.perf_counter() - started)
+    logging.debug("ARP-Scan output: %s", output)
+    return parse_arp_scan(output)
+
+
+async def _arp_scan_output(timeout: float) -> str:
+    process = await asyncio.create_subprocess_exec(
+        'arp-scan', '--localnet', '--quiet',
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        stdout, _ = await asyncio.wait_for(process.communicate(), timeout=timeout)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        raise
+    if process.returncode != 0:
+        raise RuntimeError(f"arp-scan exited with code {process.returncode}")
+    return stdout.decode(errors='replace')
+
+
+class ArpCache:
+    """Shared, time-limited cache of the arp-scan results.
+
+    Concurrent callers that need a fresh table share a single arp-scan run,
+    and a background task keeps the table warm so most callers never wait.
+    ``on_change`` (if given) is called with the old and the new IP->MAC
+    table after every successful scan but the first.
+    """
+
+    def __init__(self, ttl: timedelta = timedelta(minutes=5), timeout: float = 10.0,
+                 on_change: Optional[Callable[[Dict[str, str], Dict[str, str]], None]] = None):
+        self.ttl = ttl
+        self.timeout = timeout
+        self.on_change = on_change
+        self.table: Dict[str, str] = {}
+        self.vendors: Dict[str, str] = {}
+        self.last_update: Optional[datetime] = None
+        self.version = 0
+        self._inflight: Optional[asyncio.Future] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def peek(self) -> ArpTables:
+        """Return the cached tables immediately, however old they are."""
+        return self.table, self.vendors
+
+    def learn(self, ip: str, mac: str):
+        """Add one entry found outside of arp-scan, e.g. by passive discovery."""
+        old_mac = self.table.get(ip)
+        if old_mac is not None and old_mac.lower() == mac.lower():
+            return
+        self.table[ip] = mac
+        self.version += 1
+        if self.on_change is not None:
+            self.on_change({ip: old_mac} if old_mac is not None else {}, {ip: mac})
+
+    def is_fresh(self) -> bool:
+        return self.last_update is not None and datetime.now() - self.last_update < self.ttl
+
+    async def _scan(self) -> ArpTables:
+        try:
+            old_table = self.table
+            started = time.perf_counter()
+            table, vendors = await run_arp_scan(self.timeout)
+            # Views built from the table stay valid if nothing changed
+            if (table, vendors) != (self.table, self.vendors):
+                self.version += 1
+            self.table, self.vendors = table, vendors
+            logging.info("ARP scan finished", extra={'fields': {
+                'hosts': len(self.table),
+                'duration_ms': round((time.perf_counter() - started) * 1000, 1)
+            }})
+            if self.on_change is not None and self.last_update is not None:
+                self.on_change(old_table, self.table)
+        except Exception as e:
+            logging.error(f"Error running arp-scan: {e}")
+        finally:
+            # A failed run also counts, so a missing arp-scan is not retried per request
+            self.last_update = datetime.now()
+            self._inflight = None
+        return self.table, self.vendors
+
+    async def refresh(self) -> ArpTables:
+        """Run arp-scan now, or join the run that is already in flight."""
+        if self._inflight is None:
+            self._inflight = asyncio.ensure_future(self._scan())
+        return await asyncio.shield(self._inflight)
+
+    async def get(self) -> ArpTables:
+        """Return the cached tables, scanning first if they are stale."""
+        if self.is_fresh():
+            return self.peek()
+        return await self.refresh()
+
+    async def _run(self):
+        while True:
+            await self.refresh()
+            await asyncio.sleep(self.ttl.total_seconds() / 2)
+
+    def start(self):
+        """Start refreshing the cache in the background."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        """Cancel the background refresh."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -1,17 +1,29 @@
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import RedirectResponse, JSONResponse
-import yaml
-from typing import List, Dict, Optional
+from fastapi.responses import RedirectResponse, JSONResponse, Response
+from typing import List, Dict, Optional, Set
+import hashlib
+import ipaddress
 import os
-from scanner import check_services, inspect_target, autoscan_network
+import uuid
+from scanner import check_services, inspect_target, autoscan_network, ProbeEngine
+from poller import StatusPoller
+from config_store import ConfigStore
+from oui_index import OuiIndex, build_from_json
+from arp import ArpCache
+from passive import PassiveDiscovery, DEFAULT_SOURCES as PASSIVE_SOURCES
+from scan_jobs import ScanJob, ScanRegistry
+from scan_cluster import ScanCoordinator, split_subnets
+from resolver import reverse_resolver
+from history import HistoryStore
+from events import EventBus, format_sse
+from log_setup import setup_logging
+import metrics
 from pydantic import BaseModel
 import asyncio
 from fastapi.responses import StreamingResponse
-import json
-import subprocess
-import re
+import time
 from functools import lru_cache
 from datetime import datetime, timedelta
 import logging
@@ -30,137 +42,435 @@ app.add_middleware(
 # Mount static files
 app.mount("/static", StaticFiles(directory="frontend"), name="static")
 
-# Cache für die ARP-Tabelle
-arp_cache = {
-    'table': {},
-    'last_update': None,
-    'update_interval': timedelta(minutes=5)
-}
-
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
-
-# Load OUI data from oui.json and normalize keys
-with open('oui.json', 'r') as f:
-    raw_oui_data = json.load(f)
-    oui_data = {k.replace('-', '').upper(): v for k, v in raw_oui_data.items()}
-
-# Log the first 10 OUI keys after loading
-logging.info(f"First 10 OUI keys: {list(oui_data.keys())[:10]}")
-
-async def update_arp_table():
-    """Aktualisiere die ARP-Tabelle im Hintergrund."""
-    global arp_cache
-    try:
-        result = subprocess.run(['arp-scan', '--localnet', '--quiet'], 
-                              capture_output=True, text=True, timeout=10)
-        if result.returncode == 0:
-            new_table = {}
-            for line in result.stdout.split('\n'):
-                match = re.match(r'^(\d+\.\d+\.\d+\.\d+)\s+([0-9a-f:]{17})', line.strip(), re.I)
-                if match:
-                    ip, mac = match.groups()
-                    new_table[ip] = mac
-            arp_cache['table'] = new_table
-            arp_cache['last_update'] = datetime.now()
-    except Exception:
-        pass
-
-def get_arp_table() -> tuple:
-    """Run arp-scan --localnet and return a mapping IP->MAC and MAC->Vendor."""
-    arp_table = {}
-    vendor_table = {}
+@app.middleware("http")
+async def time_requests(request: Request, call_next):
+    """Record the handling time of every request per route template."""
+    started = time.perf_counter()
+    metrics.http_requests_in_flight.inc()
+    status = 500
     try:
-        result = subprocess.run(['arp-scan', '--localnet', '--quiet'], 
-                              capture_output=True, text=True, timeout=10)
-        if result.returncode == 0:
-            logging.info(f"ARP-Scan output: {result.stdout}")
-            for line in result.stdout.split('\n'):
-                if not line.strip():
-                    continue
-                # arp-scan output: IP MAC [Vendor]
-                parts = line.strip().split()
-                if len(parts) >= 3:
-                    ip = parts[0]
-                    mac = parts[1]
-                    vendor = ' '.join(parts[2:])
-                    arp_table[ip] = mac
-                    vendor_table[mac] = vendor[:20]  # Limit vendor to 20 chars
-                    logging.info(f"Found vendor for {mac}: {vendor[:20]}")
-                    logging.info(f"Found MAC address: {mac}, Manufacturer: {get_vendor(mac)}")
-                    # Add additional logging for MAC address processing and OUI lookup
-                    oui = mac.replace(':', '').upper()[:6]
-                    logging.info(f"Processing MAC address: {mac}, OUI: {oui}, Manufacturer: {oui_data.get(oui, 'Not found')}")
-                elif len(parts) == 2:
-                    ip = parts[0]
-                    mac = parts[1]
-                    arp_table[ip] = mac
-    except Exception as e:
-        logging.error(f"Error in get_arp_table: {e}")
-    logging.info(f"ARP table: {arp_table}")
-    logging.info(f"Vendor table: {vendor_table}")
-    return arp_table, vendor_table
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        metrics.http_requests_in_flight.dec()
+        route = request.scope.get('route')
+        if route is not None:
+            path = route.path
+        else:
+            # Keep the label set small for static files and unknown paths
+            path = '/static' if request.url.path.startswith('/static/') else 'unmatched'
+        metrics.http_request_seconds.labels(request.method, path, status).observe(
+            time.perf_counter() - started)
+
+# Configure logging: records are written by a background thread.
+# LOG_LEVEL=DEBUG shows per-device details, LOG_FORMAT=json JSON lines
+log_listener = setup_logging(os.environ.get('LOG_LEVEL', 'INFO'),
+                             os.environ.get('LOG_FORMAT') == 'json')
+
+# Open the precompiled OUI index, rebuilding it if oui.json is newer
+if not os.path.exists('oui.idx') or os.path.getmtime('oui.idx') < os.path.getmtime('oui.json'):
+    logging.info("Built oui.idx from oui.json: %d entries", build_from_json('oui.json', 'oui.idx'))
+oui_index = OuiIndex('oui.idx')
+
+# Verteilt Statusänderungen an /events-Clients
+event_bus = EventBus()
+
+def publish_arp_changes(old_table: Dict[str, str], new_table: Dict[str, str]):
+    """Push MAC changes and unknown devices found by arp-scan."""
+    for ip, mac in new_table.items():
+        old_mac = old_table.get(ip)
+        if old_mac is not None and old_mac.lower() != mac.lower():
+            event_bus.publish("mac_changed", {"ip": ip, "old": old_mac, "new": mac, "vendor": get_vendor(mac)})
+        elif old_mac is None and config_store.get_device(ip) is None:
+            event_bus.publish("device_seen", {"ip": ip, "mac": mac, "vendor": get_vendor(mac)})
+
+# Cache für die ARP-Tabelle
+arp_cache = ArpCache(ttl=timedelta(minutes=5), on_change=publish_arp_changes)
+
+# Verlauf der Dienst-Checks
+history_store = HistoryStore('history.db')
+
+# Laufende und kürzlich beendete Autoscans
+scan_registry = ScanRegistry()
+
+config_store = ConfigStore('config.yaml')
 
 def load_config() -> Dict:
-    """Load configuration from YAML file."""
-    if os.path.exists('config.yaml'):
-        with open('config.yaml', 'r') as f:
-            config = yaml.safe_load(f)
-            if not config:
-                config = {}
-    else:
-        config = {}
-    # Setze Defaults, falls Keys fehlen
-    if 'services' not in config or config['services'] is None:
-        config['services'] = []
-    if 'devices' not in config or config['devices'] is None:
-        config['devices'] = []
-    if 'default_ports' not in config or config['default_ports'] is None:
-        config['default_ports'] = [80, 443, 22, 21, 25, 1433, 3306, 5432, 27017]
-    return config
-
-def save_config(config: Dict):
-    """Save configuration to YAML file."""
-    with open('config.yaml', 'w') as f:
-        yaml.dump(config, f)
+    """Return the in-memory configuration (treat as read-only)."""
+    return config_store.get()
+
+def get_probe_engine(config: Dict) -> ProbeEngine:
+    """Build a probe engine from the scan_settings section of the config."""
+    settings = config.get('scan_settings') or {}
+    return ProbeEngine(
+        concurrency=settings.get('probe_concurrency', 100),
+        per_host=settings.get('probe_per_host', 8),
+        timeout=settings.get('timeout', 1.0),
+        deadline=settings.get('probe_deadline', 10.0)
+    )
+
+def get_scan_options(config: Dict, options: Dict) -> Dict:
+    """Return the ProbeEngine arguments for one autoscan.
+
+    Defaults come from scan_settings and can be overridden per request with
+    ``max_sockets``, ``per_host``, ``rate``, ``timeout`` and ``adaptive``.
+    """
+    settings = config.get('scan_settings') or {}
+    return {
+        'concurrency': options.get('max_sockets', settings.get('scan_max_sockets', 256)),
+        'per_host': options.get('per_host', settings.get('scan_per_host', 32)),
+        'timeout': options.get('timeout', settings.get('timeout', 1.0)),
+        'rate': options.get('rate', settings.get('scan_rate', 500)),
+        'adaptive': options.get('adaptive', settings.get('scan_adaptive', True)),
+        'prioritize': True
+    }
+
+def get_scan_engine(config: Dict, options: Dict) -> ProbeEngine:
+    """Build the probe engine for one in-process autoscan."""
+    return ProbeEngine(**get_scan_options(config, options))
+
+def get_scan_coordinator(config: Dict, subnets: List[str]) -> Optional[ScanCoordinator]:
+    """Return a coordinator if the scan should be spread over worker processes.
+
+    That is the case when remote workers are configured or the subnets add
+    up to more than one /24 shard; smaller scans run in-process.
+    """
+    settings = config.get('scan_settings') or {}
+    remote_workers = settings.get('scan_remote_workers') or []
+    if not remote_workers and len(split_subnets(subnets)) <= 1:
+        return None
+    return ScanCoordinator(
+        processes=settings.get('scan_workers'),
+        remote_workers=remote_workers,
+        token=settings.get('scan_worker_token')
+    )
 
 @app.get("/")
 async def root():
     """Redirect to the web interface."""
     return RedirectResponse(url="/static/index.html")
 
-@app.get("/status")
-async def get_status():
-    """Get status of all services."""
+async def probe_services() -> List[Dict]:
+    """Check all configured services, sorted by IP."""
     config = load_config()
     services = config.get('services', [])
     # Sortiere nach IP
     def ip_key(s):
         return list(map(int, s.get('host', '0.0.0.0').split('.')))
     services_sorted = sorted(services, key=ip_key)
-    return await check_services(services_sorted)
+    started = time.perf_counter()
+    results = await check_services(services_sorted, get_probe_engine(config))
+    metrics.status_check_seconds.observe(time.perf_counter() - started)
+    # Names come from the shared cache; misses are resolved for the next run
+    reverse_resolver.prefetch({r['host'] for r in results})
+    for service, result in zip(services_sorted, results):
+        result['id'] = service.get('id')
+        result['dns'] = reverse_resolver.peek(result['host']) or ''
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, history_store.record, results)
+    except Exception as e:
+        logging.error(f"Error recording service history: {e}")
+    return results
+
+def get_poll_settings() -> tuple:
+    """Return the (interval, jitter) pair for the status poller."""
+    settings = load_config().get('scan_settings') or {}
+    return settings.get('status_interval', 30), settings.get('status_jitter', 0.1)
+
+def publish_status_changes(changed: List[Dict], removed: List[tuple]):
+    """Push service transitions found by the status poller."""
+    for result in changed:
+        event_bus.publish("service", result)
+    for host, port in removed:
+        event_bus.publish("service_removed", {"host": host, "port": port})
+
+status_poller = StatusPoller(probe_services, get_poll_settings, publish_status_changes)
+
+def in_monitored_network(ip: str) -> bool:
+    """Return True for addresses in ``network_ranges`` (any private address if none are set)."""
+    address = ipaddress.ip_address(ip)
+    ranges = load_config().get('network_ranges') or []
+    if ranges:
+        return any(address in ipaddress.ip_network(r, strict=False) for r in ranges)
+    return address.is_private and not (address.is_loopback or address.is_link_local)
+
+def record_passive_device(observation: Dict):
+    """Add or refresh a device found by passive discovery."""
+    ip, mac = observation['ip'], observation.get('mac') or ''
+    seen = datetime.now().isoformat(timespec='seconds')
+    stored = config_store.get_device(ip)
+    if stored is None:
+        stored = {'alias': observation.get('hostname') or f"Unknown Device ({ip})", 'ip': ip, 'mac': mac,
+                  'last_seen': seen}
+        added, _ = config_store.upsert_devices([stored])
+    elif mac and stored.get('mac') in (None, '', 'Unknown'):
+        # Importierte Geräte haben noch keine MAC
+        added = []
+        with config_store.transaction(reindex=False):
+            stored['mac'] = mac
+            stored['last_seen'] = seen
+    else:
+        # Unchanged device: no immediate rewrite of config.yaml
+        added = []
+        config_store.stamp(stored, 'last_seen', seen)
+    if mac:
+        # Online status and MAC change events without waiting for arp-scan
+        arp_cache.learn(ip, mac)
+    if added:
+        logging.info("New device", extra={'fields': {
+            'ip': ip, 'mac': mac or '-', 'vendor': get_vendor(mac) if mac else '-',
+            'source': observation['source']
+        }})
+        event_bus.publish("device", device_view(stored, arp_cache.table))
+
+passive_discovery = PassiveDiscovery(record_passive_device, accept=in_monitored_network)
+
+@app.on_event("startup")
+async def start_background_tasks():
+    status_poller.start()
+    arp_cache.start()
+    settings = load_config().get('scan_settings') or {}
+    if settings.get('passive_discovery', True):
+        await passive_discovery.start(settings.get('passive_sources', PASSIVE_SOURCES))
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    await status_poller.stop()
+    await arp_cache.stop()
+    await passive_discovery.stop()
+    await scan_registry.stop()
+    config_store.flush()
+    history_store.close()
+    log_listener.stop()
+
+# Werte, die erst beim Abruf von /metrics gelesen werden
+metrics.Gauge('hns_sse_clients', 'Connected /events clients.').set_function(lambda: len(event_bus))
+metrics.Gauge('hns_scans_running', 'Autoscans in progress.').set_function(
+    lambda: sum(1 for job in scan_registry.jobs.values() if not job.done))
+metrics.Gauge('hns_devices', 'Configured devices.').set_function(lambda: len(config_store.get()['devices']))
+metrics.Gauge('hns_services', 'Configured services.').set_function(lambda: len(config_store.get()['services']))
+metrics.Gauge('hns_status_age_seconds', 'Age of the last background service check.').set_function(
+    lambda: (datetime.now() - status_poller.last_run).total_seconds() if status_poller.last_run else float('nan'))
+
+@app.get("/metrics")
+async def get_metrics():
+    """Expose counters, gauges and histograms in the Prometheus text format."""
+    return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+# Neuer Präfix bei jedem Start, damit alte ETags nicht zufällig passen
+ETAG_PREFIX = uuid.uuid4().hex[:8]
+
+def make_etag(*parts) -> str:
+    """Build a strong ETag from the versions and parameters a view depends on."""
+    return '"' + hashlib.sha1(repr((ETAG_PREFIX,) + parts).encode()).hexdigest()[:20] + '"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Check the If-None-Match header against an ETag."""
+    header = request.headers.get('if-none-match')
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(',')]
+    return '*' in tags or etag in [tag[2:] if tag.startswith('W/') else tag for tag in tags]
+
+def parse_subnet(subnet: Optional[str]):
+    """Parse a ``subnet`` filter parameter, None if not given."""
+    if not subnet:
+        return None
+    try:
+        return ipaddress.ip_network(subnet, strict=False)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-@app.get("/devices")
-async def get_devices():
-    """Get all devices with open ports count."""
+def in_subnet(ip: str, network) -> bool:
+    try:
+        return ipaddress.ip_address(ip) in network
+    except ValueError:
+        return False  # Hostname statt IP
+
+def paginated_response(items: List[Dict], offset: int, limit: Optional[int], etag: str) -> JSONResponse:
+    """Return one page of ``items`` with the total count and ETag in the headers."""
+    if offset < 0 or (limit is not None and limit < 1):
+        raise HTTPException(status_code=400, detail="offset must be >= 0 and limit >= 1")
+    page = items[offset:offset + limit] if limit is not None else items[offset:]
+    return JSONResponse(page, headers={
+        'ETag': etag,
+        'X-Total-Count': str(len(items)),
+        # Browsers revalidate with If-None-Match on every request
+        'Cache-Control': 'no-cache'
+    })
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={'ETag': etag, 'Cache-Control': 'no-cache'})
+
+@app.get("/status")
+async def get_status(request: Request, fresh: bool = False, state: Optional[str] = None,
+                     subnet: Optional[str] = None, host: Optional[str] = None,
+                     offset: int = 0, limit: Optional[int] = None):
+    """Get status of all services from the last background check.
+
+    Pass ``?fresh=1`` to re-probe all services before answering. The list
+    can be filtered by ``state`` (``up`` or ``down``), ``subnet`` (CIDR)
+    and ``host`` and paged with ``offset`` and ``limit``; the number of
+    matching services is returned in ``X-Total-Count``. Unchanged views
+    are answered with 304 Not Modified.
+    """
+    if state not in (None, 'up', 'down'):
+        raise HTTPException(status_code=400, detail="state must be 'up' or 'down'")
+    results = await status_poller.get(fresh)
+    etag = make_etag('status', status_poller.version, state, subnet, host, offset, limit)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    network = parse_subnet(subnet)
+    if state is not None or network is not None or host:
+        up = state == 'up'
+        results = [
+            r for r in results
+            if (state is None or r['port_open'] == up)
+            and (network is None or in_subnet(r['host'], network))
+            and (not host or r['host'] == host)
+        ]
+    return paginated_response(results, offset, limit, etag)
+
+@app.get("/history")
+async def get_history(host: Optional[str] = None, port: Optional[int] = None,
+                      start: Optional[float] = None, end: Optional[float] = None,
+                      resolution: Optional[str] = None):
+    """Get uptime and latency history.
+
+    With ``host`` and ``port`` the time series of that service is returned,
+    otherwise a per-service summary. ``start`` and ``end`` are Unix
+    timestamps (default: the last 24 hours); ``resolution`` is ``raw``,
+    ``1m`` or ``1h`` (default: chosen from the range).
+    """
+    end = end if end is not None else datetime.now().timestamp()
+    start = start if start is not None else end - 86400
+    loop = asyncio.get_running_loop()
+    if host is None or port is None:
+        return await loop.run_in_executor(None, history_store.summary, start, end)
+    try:
+        return await loop.run_in_executor(None, history_store.query, host, port, start, end, resolution)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def device_view(device: Dict, arp_table: Dict[str, str], open_hosts: Set[str] = frozenset()) -> Dict:
+    """Copy a configured device and add service count, MAC, DNS name, vendor and online state.
+
+    A device is online if it is in the ARP table or one of its services was
+    open at the last status check.
+    """
+    device = dict(device)
+    device['open_ports'] = config_store.service_counts.get(device['ip'], 0)
+    # Add vendor info to device
+    mac = device.get('mac') or arp_table.get(device['ip'], '')
+    device['mac'] = mac
+    device['dns'] = reverse_resolver.peek(device['ip']) or device.get('dns', '')
+    vendor = get_vendor(mac)
+    device['vendor'] = vendor
+    device['online'] = device['ip'] in arp_table or device['ip'] in open_hosts
+    logging.debug("Device %s with MAC %s has vendor: %s", device['ip'], mac, vendor)
+    return device
+
+def devices_version() -> tuple:
+    """Versions of everything the device list is built from."""
+    # The status only matters through the hosts with an open service
+    return (config_store.version, config_store.stamp_version, arp_cache.version, reverse_resolver.version,
+            status_poller.up_version)
+
+# Zuletzt berechnete Geräteliste und ihre Version
+_devices_cache: Dict = {'version': None, 'devices': []}
+
+def build_devices() -> List[Dict]:
+    """Return all devices as shown by /devices, sorted by IP.
+
+    The list is rebuilt only when the config, the ARP table, a DNS name or
+    the set of hosts with an open service changed; treat it as read-only.
+    """
+    version = devices_version()
+    if _devices_cache['version'] == version:
+        return _devices_cache['devices']
     config = load_config()
-    devices = config.get('devices', [])
-    services = config.get('services', [])
-    arp_table, vendor_table = get_arp_table()
-    
-    # Count open ports for each device
-    for device in devices:
-        device['open_ports'] = sum(1 for service in services if service['host'] == device['ip'])
-        # Add vendor info to device
-        mac = device.get('mac', '')
-        vendor = get_vendor(mac)
-        device['vendor'] = vendor
-        logging.info(f"Device {device['ip']} with MAC {mac} has vendor: {vendor}")
-    
+    # Never wait for arp-scan here, the background refresh keeps the cache warm
+    arp_table, vendor_table = arp_cache.peek()
+    devices = [device_view(d, arp_table, status_poller.up_hosts) for d in config.get('devices', [])]
+
+    # Resolve unknown names in the background instead of making the request wait
+    reverse_resolver.prefetch(d['ip'] for d in devices if reverse_resolver.peek(d['ip']) is None)
+
     # Sort by IP
     def ip_key(d):
         return list(map(int, d.get('ip', '0.0.0.0').split('.')))
-    return sorted(devices, key=ip_key)
+    devices.sort(key=ip_key)
+    _devices_cache['version'] = version
+    _devices_cache['devices'] = devices
+    return devices
+
+@app.get("/devices")
+async def get_devices(request: Request, vendor: Optional[str] = None, subnet: Optional[str] = None,
+                      state: Optional[str] = None, offset: int = 0, limit: Optional[int] = None):
+    """Get all devices with open ports count.
+
+    The list can be filtered by ``vendor`` (substring, case-insensitive),
+    ``subnet`` (CIDR) and ``state`` (``online`` or ``offline``) and paged
+    with ``offset`` and ``limit``; the number of matching devices is
+    returned in ``X-Total-Count``. Unchanged views are answered with 304
+    Not Modified without building the list.
+    """
+    if state not in (None, 'online', 'offline'):
+        raise HTTPException(status_code=400, detail="state must be 'online' or 'offline'")
+    started = time.perf_counter()
+    etag = make_etag('devices', devices_version(), vendor, subnet, state, offset, limit)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    devices = build_devices()
+    network = parse_subnet(subnet)
+    if vendor or network is not None or state is not None:
+        vendor = (vendor or '').lower()
+        online = state == 'online'
+        devices = [
+            d for d in devices
+            if vendor in d['vendor'].lower()
+            and (network is None or in_subnet(d['ip'], network))
+            and (state is None or d['online'] == online)
+        ]
+    response = paginated_response(devices, offset, limit, etag)
+    logging.info("Served /devices", extra={'fields': {
+        'devices': len(devices),
+        'duration_ms': round((time.perf_counter() - started) * 1000, 2)
+    }})
+    return response
+
+@app.get("/events")
+async def get_events(request: Request):
+    """Push state changes as Server-Sent Events.
+
+    A ``snapshot`` event with all services and devices is sent first, then
+    only transitions: ``service`` (state or name changed, or new),
+    ``service_removed``, ``device`` (added by autoscan), ``device_seen``
+    (unknown IP in the ARP table) and ``mac_changed``.
+    """
+    queue = event_bus.subscribe()
+
+    async def stream():
+        try:
+            snapshot = {"services": await status_poller.get(), "devices": build_devices()}
+            yield format_sse("snapshot", snapshot)
+            while True:
+                event = await event_bus.next(queue)
+                if event is None:
+                    return
+                event_type, data = event
+                if not event_type:
+                    if await request.is_disconnected():
+                        return
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_sse(event_type, data)
+        finally:
+            event_bus.unsubscribe(queue)
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.get("/config")
 async def get_config():
@@ -170,12 +480,14 @@ async def get_config():
 class InspectRequest(BaseModel):
     host: str
     ports: List[int]
+    fingerprint: bool = False
 
 @app.post("/inspect")
 async def inspect_host(request: InspectRequest):
     """Manually inspect a host and its ports."""
     try:
-        return await inspect_target(request.host, request.ports)
+        return await inspect_target(request.host, request.ports, get_probe_engine(load_config()),
+                                    request.fingerprint)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -185,121 +497,289 @@ class AutoscanRequest(BaseModel):
     subnet: str
     ports: List[int] = None
 
+def get_known_hosts(config: Dict, subnets: List[str], ports: List[int]) -> Dict[str, List[int]]:
+    """Return the ports to re-verify per known host of the subnets for a delta rescan.
+
+    Known hosts are the configured devices and service hosts. Hosts whose
+    last full port sweep is older than ``scan_full_interval`` seconds (or
+    that never had one) get the full port list again.
+    """
+    settings = config.get('scan_settings') or {}
+    full_before = datetime.now() - timedelta(seconds=settings.get('scan_full_interval', 86400))
+    networks = [ipaddress.ip_network(subnet, strict=False) for subnet in subnets]
+    # ``config`` comes from config_store.get(), so the index is current
+    devices_by_ip = config_store.devices_by_ip
+    host_ports = {device['ip']: set() for device in config['devices']}
+    for service in config['services']:
+        host_ports.setdefault(service['host'], set()).add(service['port'])
+    known = {}
+    for ip, known_ports in host_ports.items():
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            continue  # Hostnamen werden nicht gescannt
+        if not any(address in network for network in networks):
+            continue
+        device = devices_by_ip.get(ip) or {}
+        last_full = device.get('last_full_scan')
+        if not last_full or datetime.fromisoformat(last_full) < full_before:
+            known_ports = known_ports | set(ports)
+        known[ip] = sorted(known_ports)
+    return known
+
+async def run_autoscan(job: ScanJob, subnets: List[str], ports: List[int], options: Dict):
+    """Scan subnets and publish every device and service as soon as it is found.
+
+    Findings are merged into the config one by one; the config store batches
+    the writes. Large scans are sharded over worker processes. With
+    ``delta`` in the options only known hosts and ports are re-verified at
+    full speed, see ``get_known_hosts``. Every device and service found gets
+    a ``last_seen`` timestamp, devices whose ports were all probed a
+    ``last_full_scan`` timestamp as well.
+    """
+    arp_table, vendor_table = await arp_cache.get()
+    logging.debug("Autoscan ARP table: %s", arp_table)
+    logging.debug("Autoscan vendor table: %s", vendor_table)
+    started = time.perf_counter()
+
+    config = load_config()
+    settings = config.get('scan_settings') or {}
+    fingerprint = None
+    if options.get('fingerprint', settings.get('scan_fingerprint', True)):
+        fingerprint = {
+            'max_bytes': options.get('banner_bytes', settings.get('banner_bytes', 256)),
+            'read_timeout': options.get('banner_timeout', settings.get('banner_timeout', 0.5))
+        }
+    known = get_known_hosts(config, subnets, ports) if options.get('delta') else None
+    sweep_rate = options.get('sweep_rate', settings.get('scan_delta_sweep_rate', 50)) if known is not None else None
+    all_ports = set(ports)
+    seen = datetime.now().isoformat(timespec='seconds')
+    found_ports = set()
+    found_services = 0
+    new_services = 0
+    last_progress = 0
+    coordinator = get_scan_coordinator(config, subnets)
+    if coordinator is None:
+        scan = autoscan_network(subnets[0], ports, get_scan_engine(config, options), fingerprint,
+                                known, sweep_rate)
+    else:
+        scan = coordinator.scan(subnets, ports, get_scan_options(config, options), fingerprint,
+                                known, sweep_rate)
+    async for progress, result in scan:
+        if result is None:
+            # Only report progress when the percentage changes
+            if progress != last_progress:
+                job.publish({
+                    "type": "progress",
+                    "progress": progress,
+                    "message": f"Scanning: {progress}%"
+                })
+                last_progress = progress
+        elif result.get("type") == "device":
+            device = result["device"]
+            device['mac'] = arp_table.get(device['ip']) or device.get('mac', '')
+            added, _ = config_store.upsert_devices([device])
+            with config_store.transaction(reindex=False):
+                stored = config_store.get_device(device['ip'])
+                stored['last_seen'] = seen
+                if known is None or all_ports <= set(known.get(device['ip'], all_ports)):
+                    stored['last_full_scan'] = seen
+            if added:
+                logging.info("New device: %s", device)
+                event_bus.publish("device", device_view(device, arp_table))
+            job.publish({"type": "device", "progress": progress, "device": device, "new": bool(added)})
+        else:
+            # Fingerprint details go to the client, not into config.yaml
+            details = result.pop('fingerprint', None)
+            added, _ = config_store.upsert_services([result])
+            with config_store.transaction(reindex=False):
+                config_store.get_service(result['host'], result['port'])['last_seen'] = seen
+            found_services += 1
+            new_services += len(added)
+            found_ports.add(result['port'])
+            job.publish({"type": "service", "progress": progress, "service": result,
+                         "fingerprint": details, "new": bool(added)})
+    metrics.autoscan_seconds.labels('delta' if known is not None else 'full').observe(
+        time.perf_counter() - started)
+    logging.info("Autoscan finished", extra={'fields': {
+        'scan_id': job.id,
+        'subnets': ','.join(subnets),
+        'delta': known is not None,
+        'open_ports': found_services,
+        'new_services': new_services,
+        'duration_s': round(time.perf_counter() - started, 2)
+    }})
+    job.publish({
+        "type": "done",
+        "progress": 100,
+        "message": f"Scan abgeschlossen. {found_services} offene Ports gefunden, {new_services} neue Dienste gespeichert.",
+        "found_ports": sorted(found_ports)
+    })
+
 @app.post("/autoscan")
 async def autoscan(request: Request):
+    """Start a scan in the background and stream its events as NDJSON.
+
+    Takes ``subnet`` or a list of ``subnets`` plus ``ports``; ``delta: true``
+    starts a delta rescan. The first event carries the ``scan_id``; if the
+    connection drops, the stream can be resumed with
+    ``GET /autoscan/{scan_id}?after=<last seq>``.
+    """
     try:
         data = await request.json()
-        subnet = data.get('subnet')
+        subnets = data.get('subnets') or ([data['subnet']] if data.get('subnet') else [])
         ports = data.get('ports', [])
-        
-        if not subnet or not ports:
+
+        if not subnets or not ports:
             raise HTTPException(status_code=400, detail="Subnet and ports are required")
-        
-        config = load_config()
-        arp_table, vendor_table = get_arp_table()
-        logging.info(f"Autoscan ARP table: {arp_table}")
-        logging.info(f"Autoscan vendor table: {vendor_table}")
-
-        found_services = []
-        found_devices = []
-
-        async def scan_progress():
-            try:
-                async for progress, result in autoscan_network(subnet, ports):
-                    if result:
-                        if isinstance(result, dict) and result.get("type") == "devices":
-                            # Save found devices
-                            for device in result["devices"]:
-                                if not any(d.get('ip') == device['ip'] for d in config['devices']):
-                                    device['mac'] = arp_table.get(device['ip'], '')
-                                    logging.info(f"New device: {device}")
-                                    config['devices'].append(device)
-                                    found_devices.append(device)
-                        else:
-                            # Collect found services
-                            found_services.append(result)
-                    yield json.dumps({
-                        "progress": progress,
-                        "message": f"Scanning: {progress}%"
-                    }) + "\n"
-                # Nach dem Scan: Alle gefundenen offenen Ports als Dienste speichern
-                new_services = 0
-                for service in found_services:
-                    if not any(s.get('host') == service['host'] and s.get('port') == service['port'] for s in config['services']):
-                        config['services'].append(service)
-                        new_services += 1
-                save_config(config)
-                # Extrahiere alle gefundenen Ports (unique, sortiert)
-                found_ports = sorted({s['port'] for s in found_services})
-                yield json.dumps({
-                    "progress": 100,
-                    "message": f"Scan abgeschlossen. {len(found_services)} offene Ports gefunden, {new_services} neue Dienste gespeichert.",
-                    "services": found_services,
-                    "devices": found_devices,
-                    "found_ports": found_ports
-                }) + "\n"
-            except Exception as e:
-                yield json.dumps({"error": str(e)}) + "\n"
-
-        return StreamingResponse(scan_progress(), media_type="application/x-ndjson")
+        try:
+            split_subnets(subnets)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        async def run(job: ScanJob):
+            job.publish({"type": "started", "scan_id": job.id, "progress": 0, "message": "Scanning: 0%"})
+            await run_autoscan(job, subnets, ports, data)
+
+        job = scan_registry.start(run)
+        return StreamingResponse(job.stream(), media_type="application/x-ndjson")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/autoscan/{scan_id}")
+async def resume_autoscan(scan_id: str, after: int = -1):
+    """Resume the event stream of a running or recently finished scan."""
+    job = scan_registry.get(scan_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Scan not found")
+    return StreamingResponse(job.stream(after), media_type="application/x-ndjson")
+
 class ServiceUpdate(BaseModel):
     name: str
     host: str
     port: int
 
-@app.put("/service/{index}")
-async def update_service(index: int, service: ServiceUpdate):
-    """Update a service in the configuration."""
-    config = load_config()
-    if index < 0 or index >= len(config['services']):
-        raise HTTPException(status_code=404, detail="Service not found")
-    
-    config['services'][index] = service.dict()
-    save_config(config)
-    return config['services'][index]
-
-@app.delete("/service/{index}")
-async def delete_service(index: int):
-    """Delete a service from the configuration."""
-    config = load_config()
-    if index < 0 or index >= len(config['services']):
-        raise HTTPException(status_code=404, detail="Service not found")
-    
-    deleted_service = config['services'].pop(index)
-    save_config(config)
-    return deleted_service
-
 class DeviceUpdate(BaseModel):
     alias: str
     ip: str
 
-@app.put("/device/{index}")
-async def update_device(index: int, device: DeviceUpdate):
-    """Update a device in the configuration."""
-    config = load_config()
-    if index < 0 or index >= len(config['devices']):
-        raise HTTPException(status_code=404, detail="Device not found")
-    
-    device_dict = device.dict()
-    # Behalte die existierende MAC-Adresse
-    device_dict['mac'] = config['devices'][index].get('mac', '')
-    config['devices'][index] = device_dict
-    save_config(config)
-    return config['devices'][index]
-
-@app.delete("/device/{index}")
-async def delete_device(index: int):
+class ServicePatch(BaseModel):
+    id: str
+    name: Optional[str] = None
+    host: Optional[str] = None
+    port: Optional[int] = None
+
+class DevicePatch(BaseModel):
+    id: str
+    alias: Optional[str] = None
+    ip: Optional[str] = None
+
+class ServiceChanges(BaseModel):
+    create: List[ServiceUpdate] = []
+    update: List[ServicePatch] = []
+    delete: List[str] = []
+
+class DeviceChanges(BaseModel):
+    create: List[DeviceUpdate] = []
+    update: List[DevicePatch] = []
+    delete: List[str] = []
+
+class BatchRequest(BaseModel):
+    devices: DeviceChanges = DeviceChanges()
+    services: ServiceChanges = ServiceChanges()
+
+def service_status(service: Dict) -> Dict:
+    """Return a configured service merged with its latest status check."""
+    for result in status_poller.snapshot:
+        if result['host'] == service['host'] and result['port'] == service['port']:
+            return dict(result, name=service['name'], id=service['id'])
+    # Noch nicht geprüft
+    return dict(service, port_open=None)
+
+def publish_config_changes(changes: Dict):
+    """Push devices and services created, updated or deleted through the API."""
+    arp_table = arp_cache.table
+    for device in changes['devices']['deleted']:
+        event_bus.publish("device_removed", {"id": device['id'], "ip": device['ip']})
+    for device in changes['devices']['created'] + changes['devices']['updated']:
+        event_bus.publish("device", device_view(device, arp_table, status_poller.up_hosts))
+    for service in changes['services']['deleted']:
+        event_bus.publish("service_removed", {"id": service['id'], "host": service['host'], "port": service['port']})
+    for service in changes['services']['created'] + changes['services']['updated']:
+        event_bus.publish("service", service_status(service))
+
+def apply_changes(devices: Optional[Dict] = None, services: Optional[Dict] = None) -> Dict:
+    """Apply changes through the config store, publish them and map errors to HTTP errors."""
+    try:
+        result = config_store.apply(devices, services)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=f"Unknown id {e.args[0]}")
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    publish_config_changes(result)
+    return result
+
+@app.post("/batch")
+async def batch(changes: BatchRequest):
+    """Create, update and delete many devices and services at once.
+
+    All changes are applied in one transaction and saved with one write;
+    if any id is unknown or an update would duplicate an entry, nothing is
+    changed. New entries that already exist are returned under ``skipped``.
+    """
+    def kind(kind_changes) -> Dict:
+        return {
+            'create': [item.dict() for item in kind_changes.create],
+            'update': [item.dict(exclude_none=True) for item in kind_changes.update],
+            'delete': kind_changes.delete,
+        }
+    result = apply_changes(kind(changes.devices), kind(changes.services))
+    logging.info("Batch applied", extra={'fields': {
+        f'{name}_{action}': len(items)
+        for name, report in result.items() for action, items in report.items()
+    }})
+    return result
+
+@app.post("/service")
+async def create_service(service: ServiceUpdate):
+    """Add a service to the configuration."""
+    result = apply_changes(services={'create': [service.dict()]})['services']
+    if not result['created']:
+        raise HTTPException(status_code=409, detail="Service already exists")
+    return result['created'][0]
+
+@app.put("/service/{service_id}")
+async def update_service(service_id: str, service: ServiceUpdate):
+    """Update a service in the configuration."""
+    update = dict(service.dict(), id=service_id)
+    return apply_changes(services={'update': [update]})['services']['updated'][0]
+
+@app.delete("/service/{service_id}")
+async def delete_service(service_id: str):
+    """Delete a service from the configuration."""
+    return apply_changes(services={'delete': [service_id]})['services']['deleted'][0]
+
+@app.post("/device")
+async def create_device(device: DeviceUpdate):
+    """Add a device to the configuration."""
+    # MAC wird beim nächsten Autoscan ermittelt
+    result = apply_changes(devices={'create': [dict(device.dict(), mac='')]})['devices']
+    if not result['created']:
+        raise HTTPException(status_code=409, detail="Device already exists")
+    return result['created'][0]
+
+@app.put("/device/{device_id}")
+async def update_device(device_id: str, device: DeviceUpdate):
+    """Update a device in the configuration; MAC and scan stamps are kept."""
+    update = dict(device.dict(), id=device_id)
+    return apply_changes(devices={'update': [update]})['devices']['updated'][0]
+
+@app.delete("/device/{device_id}")
+async def delete_device(device_id: str):
     """Delete a device from the configuration."""
-    config = load_config()
-    if index < 0 or index >= len(config['devices']):
-        raise HTTPException(status_code=404, detail="Device not found")
-    
-    deleted_device = config['devices'].pop(index)
-    save_config(config)
-    return deleted_device
+    return apply_changes(devices={'delete': [device_id]})['devices']['deleted'][0]
 
 @app.get("/export")
 async def export_config():
@@ -312,44 +792,54 @@ async def export_config():
     return export_data
 
 @app.post("/import")
-async def import_config(request: Request):
-    """Import devices and services from simplified format."""
+async def import_config(request: Request, update: bool = False):
+    """Import devices and services from simplified format.
+
+    Entries that already exist are skipped unless ``?update=1`` is given,
+    in which case their alias/name is overwritten.
+    """
     try:
         data = await request.json()
-        config = load_config()
-        
-        # Import devices
-        for device in data.get('devices', []):
-            if not any(d['ip'] == device['ip'] for d in config['devices']):
-                config['devices'].append({
-                    'alias': device['alias'],
-                    'ip': device['ip'],
-                    'mac': ''  # MAC wird beim nächsten Autoscan aktualisiert
-                })
-        
-        # Import services
-        for service in data.get('services', []):
-            if not any(s['host'] == service['host'] and s['port'] == service['port'] for s in config['services']):
-                config['services'].append({
-                    'name': service['name'],
-                    'host': service['host'],
-                    'port': service['port']
-                })
-        
-        save_config(config)
-        return {"message": "Import successful"}
+        devices = [{
+            'alias': device['alias'],
+            'ip': device['ip'],
+            'mac': ''  # MAC wird beim nächsten Autoscan aktualisiert
+        } for device in data.get('devices', [])]
+        services = [{
+            'name': service['name'],
+            'host': service['host'],
+            'port': service['port']
+        } for service in data.get('services', [])]
+        if update:
+            # Keep the MAC of known devices, only the alias is imported
+            for device in devices:
+                if config_store.get_device(device['ip']) is not None:
+                    del device['mac']
+
+        added_devices, updated_devices = config_store.upsert_devices(devices, update)
+        added_services, updated_services = config_store.upsert_services(services, update)
+        publish_config_changes({
+            'devices': {'created': added_devices, 'updated': updated_devices, 'deleted': []},
+            'services': {'created': added_services, 'updated': updated_services, 'deleted': []},
+        })
+        return {
+            "message": "Import successful",
+            "devices_added": len(added_devices),
+            "devices_updated": len(updated_devices),
+            "services_added": len(added_services),
+            "services_updated": len(updated_services)
+        }
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@lru_cache(maxsize=4096)
 def get_vendor(mac: str) -> str:
-    """Get vendor information using the oui.json file."""
+    """Get vendor information from the OUI index (MA-L, MA-M and MA-S)."""
     if not mac:
         return ""
     try:
-        # Extract the first 6 characters of the MAC address (OUI)
-        oui = mac.replace(':', '').replace('-', '').upper()[:6]
-        vendor = oui_data.get(oui, "")
-        logging.info(f"MAC: {mac}, OUI: {oui}, Vendor found: {vendor}")
+        vendor = oui_index.lookup(mac)
+        logging.debug("MAC: %s, Vendor found: %s", mac, vendor)
         return vendor
     except Exception as e:
         logging.error(f"Error in get_vendor for MAC {mac}: {e}")
@@ -362,6 +852,10 @@ if __name__ == "__main__":
 
     parser = argparse.ArgumentParser(description="Start HomeNetSupervise backend.")
     parser.add_argument('--port', type=int, default=8000, help='Port to run the server on (default: 8000)')
+    parser.add_argument('--log-level', default=None, help='Log level, e.g. DEBUG (default: $LOG_LEVEL or INFO)')
     args = parser.parse_args()
+    if args.log_level:
+        logging.getLogger().setLevel(args.log_level.upper())
 
-    uvicorn.run(app, host="0.0.0.0", port=args.port) 
\ No newline at end of file
+    # No log config of its own: uvicorn's loggers propagate into the queue
+    uvicorn.run(app, host="0.0.0.0", port=args.port, log_config=None) 
\ No newline at end of file
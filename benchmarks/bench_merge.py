@@ -0,0 +1,66 @@
+"""Measure how config merges scale with the size of an import.
+
+Run from the repository root:
+
+    python benchmarks/bench_merge.py [--existing 20000] [--sizes 1000,5000,20000]
+
+For every import size half of the entries already exist in the config, the
+other half are new. Merge time per entry should stay flat as the import
+grows; a rising per-entry time means the merge path went quadratic again.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config_store import ConfigStore  # noqa: E402
+
+
+def make_devices(start: int, count: int):
+    return [{'alias': f'Device {i}', 'ip': f'10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}', 'mac': ''}
+            for i in range(start, start + count)]
+
+
+def make_services(start: int, count: int):
+    return [{'name': f'Service {i}', 'host': f'10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}', 'port': 80}
+            for i in range(start, start + count)]
+
+
+async def bench(existing: int, size: int) -> float:
+    with tempfile.TemporaryDirectory() as tmp:
+        # A long flush delay keeps YAML serialisation out of the measurement
+        store = ConfigStore(os.path.join(tmp, 'config.yaml'), flush_delay=3600)
+        store.upsert_devices(make_devices(0, existing))
+        store.upsert_services(make_services(0, existing))
+        first = existing - size // 2
+        devices = make_devices(first, size)
+        services = make_services(first, size)
+        started = time.perf_counter()
+        store.upsert_devices(devices)
+        store.upsert_services(services)
+        return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--existing', type=int, default=20000, help='Entries already in the config')
+    parser.add_argument('--sizes', default='1000,2000,5000,10000,20000', help='Comma separated import sizes')
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(',')]
+    print(f"{'import size':>12} {'total ms':>10} {'us/entry':>10}")
+    per_entry = []
+    for size in sizes:
+        elapsed = asyncio.run(bench(args.existing, size))
+        per_entry.append(elapsed / size)
+        print(f"{size:>12} {elapsed * 1000:>10.2f} {elapsed / size * 1e6:>10.2f}")
+    growth = per_entry[-1] / per_entry[0]
+    print(f"per-entry cost grew {growth:.2f}x from {sizes[0]} to {sizes[-1]} entries")
+
+
+if __name__ == '__main__':
+    main()
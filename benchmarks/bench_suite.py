@@ -0,0 +1,195 @@
+"""Benchmark the scanner and backend hot paths against a simulated network.
+
+Run from the repository root:
+
+    python benchmarks/bench_suite.py --save baseline.json
+    ... change code ...
+    python benchmarks/bench_suite.py --baseline baseline.json
+
+Every benchmark runs at increasing scales (see ``SCALES``) on loopback
+listeners from ``simnet.py``; ``ping``, ``arp`` and ``arp-scan`` are the
+fakes in ``benchmarks/fakebin``. With ``--baseline`` each result is
+compared to the saved one, and the exit code is 1 if any got slower by more
+than ``--threshold``.
+
+- ``check_services``: one status check of N configured services (2% of the
+  hosts drop packets, so some probes run into the timeout)
+- ``autoscan``: ``autoscan_network`` with fingerprinting over a /N subnet
+  that is 30% populated
+- ``devices``: the ``/devices`` handler for N devices after a config
+  change, and again with the list cached (needs fastapi)
+- ``merge``: merging an import of N entries into N existing ones
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import scanner  # noqa: E402
+from config_store import ConfigStore, DEFAULT_PORTS  # noqa: E402
+from simnet import SimulatedNetwork  # noqa: E402
+
+SIM_PORTS = (22, 80, 443)
+
+# Benchmark: (default scales, --quick scales)
+SCALES = {
+    'check_services': ([300, 1500, 6000], [300, 1500]),
+    'autoscan': ([26, 25, 24], [26]),
+    'devices': ([500, 2000, 10000], [500, 2000]),
+    'merge': ([1000, 5000, 20000], [1000, 5000]),
+}
+
+
+async def _no_icmp(hosts, timeout=1.0, rate=2000):
+    return None
+
+
+async def bench_check_services(scale: int, args) -> Dict:
+    async with SimulatedNetwork(hosts=scale // len(SIM_PORTS), ports=SIM_PORTS,
+                                drop_rate=0.02, latency=args.latency) as net:
+        services = net.services()
+        engine = scanner.ProbeEngine(concurrency=256, per_host=8, timeout=args.timeout)
+        started = time.perf_counter()
+        results = await scanner.check_services(services, engine)
+        elapsed = time.perf_counter() - started
+    return {'seconds': elapsed, 'per_second': len(results) / elapsed}
+
+
+async def bench_autoscan(prefix: int, args) -> Dict:
+    addresses = 2 ** (32 - prefix) - 2
+    async with SimulatedNetwork(hosts=int(addresses * 0.3), ports=SIM_PORTS, presence=0.3,
+                                drop_rate=0.02, latency=args.latency) as net:
+        os.environ.update(net.environment())
+        engine = scanner.ProbeEngine(concurrency=256, per_host=32, timeout=args.timeout,
+                                     rate=args.rate, adaptive=True, prioritize=True)
+        fingerprint = {'max_bytes': 256, 'read_timeout': 0.5}
+        found = 0
+        started = time.perf_counter()
+        async for _, result in scanner.autoscan_network(net.subnet(prefix), DEFAULT_PORTS, engine, fingerprint):
+            if result is not None and result.get('type') != 'device':
+                found += 1
+        elapsed = time.perf_counter() - started
+    return {'seconds': elapsed, 'per_second': addresses / elapsed, 'open_ports': found}
+
+
+async def bench_devices(scale: int, args) -> Dict:
+    try:
+        os.chdir(ROOT)
+        import backend
+        from starlette.requests import Request
+    except ImportError as e:
+        return {'skipped': str(e)}
+    from resolver import ReverseResolver
+    logging.getLogger().setLevel(logging.WARNING)
+    # Each scale runs on a new event loop
+    backend.reverse_resolver = ReverseResolver()
+    request = Request({'type': 'http', 'method': 'GET', 'path': '/devices',
+                       'headers': [], 'query_string': b''})
+    net = SimulatedNetwork(hosts=scale, ports=SIM_PORTS)
+    with tempfile.TemporaryDirectory() as tmp:
+        backend.config_store = ConfigStore(os.path.join(tmp, 'config.yaml'), flush_delay=3600)
+        backend.config_store.upsert_devices(net.devices())
+        backend.config_store.upsert_services(net.services())
+        backend.arp_cache.table = net.arp_table()
+        backend.arp_cache.version += 1
+        await backend.get_devices(request)  # warm up the vendor cache
+        timings, cached = [], []
+        for _ in range(args.rounds):
+            # A config change forces the list to be rebuilt
+            with backend.config_store.transaction(reindex=False):
+                pass
+            started = time.perf_counter()
+            await backend.get_devices(request)
+            timings.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            await backend.get_devices(request)
+            cached.append(time.perf_counter() - started)
+    elapsed = min(timings)
+    return {'seconds': elapsed, 'per_second': scale / elapsed, 'cached_seconds': min(cached)}
+
+
+async def bench_merge_import(scale: int, args) -> Dict:
+    from bench_merge import bench
+    elapsed = min([await bench(scale, scale) for _ in range(args.rounds)])
+    return {'seconds': elapsed, 'per_second': scale / elapsed}
+
+
+BENCHMARKS: Dict[str, Callable] = {
+    'check_services': bench_check_services,
+    'autoscan': bench_autoscan,
+    'devices': bench_devices,
+    'merge': bench_merge_import,
+}
+
+
+def compare(results: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """Return a line for every result that is slower than the baseline by more than ``threshold``."""
+    regressions = []
+    for name, scales in results.items():
+        for scale, result in scales.items():
+            before = baseline.get(name, {}).get(scale, {}).get('seconds')
+            if before and 'seconds' in result and result['seconds'] > before * (1 + threshold):
+                regressions.append(f"{name} @ {scale}: {before:.4f}s -> {result['seconds']:.4f}s "
+                                   f"({result['seconds'] / before - 1:+.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--only', default=','.join(BENCHMARKS), help='Comma separated benchmarks to run')
+    parser.add_argument('--quick', action='store_true', help='Run only the smaller scales')
+    parser.add_argument('--timeout', type=float, default=0.5, help='Connect timeout per probe (default: 0.5)')
+    parser.add_argument('--rate', type=float, default=2000, help='Autoscan connection rate (default: 2000)')
+    parser.add_argument('--latency', type=float, default=0.002, help='Answer delay of simulated services')
+    parser.add_argument('--rounds', type=int, default=5,
+                        help='Repetitions of fast benchmarks, the best counts (default: 5)')
+    parser.add_argument('--icmp', action='store_true',
+                        help='Use the real ICMP sweep (every loopback address answers) instead of the fake ping')
+    parser.add_argument('--save', help='Write the results as JSON to this file')
+    parser.add_argument('--baseline', help='Compare against results saved with --save')
+    parser.add_argument('--threshold', type=float, default=0.25, help='Allowed slowdown (default: 0.25)')
+    args = parser.parse_args()
+
+    if not args.icmp:
+        # Fall back to the (fake) ping binary, which knows which hosts are up
+        scanner.sweep_hosts = _no_icmp
+
+    results: Dict[str, Dict[str, Dict]] = {}
+    print(f"{'benchmark':<16} {'scale':>7} {'seconds':>10} {'per second':>12}")
+    for name in args.only.split(','):
+        default, quick = SCALES[name]
+        results[name] = {}
+        for scale in (quick if args.quick else default):
+            result = asyncio.run(BENCHMARKS[name](scale, args))
+            results[name][str(scale)] = result
+            if 'skipped' in result:
+                print(f"{name:<16} {scale:>7} skipped: {result['skipped']}")
+                break
+            print(f"{name:<16} {scale:>7} {result['seconds']:>10.4f} {result['per_second']:>12.1f}")
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'python': platform.python_version(), 'results': results}, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
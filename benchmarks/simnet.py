@@ -0,0 +1,168 @@
+"""A simulated home network on loopback addresses for benchmarks.
+
+Every simulated host gets its own address in 127.0.0.0/8 (Linux routes the
+whole block to the loopback interface), so real sockets, real connects and
+real timeouts are measured without touching the actual network:
+
+- open ports have a listener that answers like the real service (SSH
+  greeting, HTTP response, ...) after the configured latency,
+- closed ports on live hosts refuse the connection immediately,
+- dropped hosts have listeners with a full accept queue on every port, so
+  SYNs are silently dropped and connects run into their timeout.
+
+``ping``, ``arp`` and ``arp-scan`` are replaced by the scripts in
+``benchmarks/fakebin``, which answer from a state file written by
+``SimulatedNetwork`` (see ``environment()``).
+"""
+import asyncio
+import ipaddress
+import json
+import os
+import random
+import resource
+import socket
+import tempfile
+from typing import Dict, List, Optional, Sequence
+
+FAKEBIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fakebin')
+
+# A few real OUI prefixes, so vendor lookups hit the index
+MAC_PREFIXES = ['b8:27:eb', 'dc:a6:32', 'f0:9f:c2', '00:11:32', '3c:22:fb', 'ac:de:48', '00:1a:11', 'cc:32:e5']
+
+BANNERS = {
+    21: b'220 (vsFTPd 3.0.3)\r\n',
+    22: b'SSH-2.0-OpenSSH_9.2p1 Debian-2\r\n',
+    25: b'220 mail.home ESMTP Postfix\r\n',
+}
+HTTP_RESPONSE = b'HTTP/1.0 200 OK\r\nServer: nginx/1.24.0\r\nContent-Length: 0\r\n\r\n'
+
+
+def raise_file_limit():
+    """Allow as many open files as the hard limit permits."""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+class SimulatedNetwork:
+    """Loopback listeners standing in for ``hosts`` devices.
+
+    Addresses are taken from ``network`` in order; ``presence`` is the share
+    of addresses that hold a device at all, ``open_rate`` the share of
+    ``ports`` open on a live device and ``drop_rate`` the share of devices
+    that drop every packet. ``latency`` (plus up to ``jitter``) seconds
+    delays every answer of a simulated service and of the fake ``ping``.
+    """
+
+    def __init__(self, hosts: int = 254, ports: Sequence[int] = (22, 80, 443),
+                 network: str = '127.42.0.0/16', presence: float = 1.0, open_rate: float = 0.5,
+                 drop_rate: float = 0.0, latency: float = 0.0, jitter: float = 0.0, seed: int = 1):
+        self.ports = list(ports)
+        self.network = ipaddress.ip_network(network)
+        self.open_rate = open_rate
+        self.drop_rate = drop_rate
+        self.latency = latency
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.state: Dict[str, Dict] = {}
+        addresses = self.network.hosts()
+        while len(self.state) < hosts:
+            ip = str(next(addresses))
+            if self.random.random() >= presence:
+                continue
+            dropped = self.random.random() < self.drop_rate
+            self.state[ip] = {
+                'alive': not dropped,
+                'mac': self.random.choice(MAC_PREFIXES) + ''.join(
+                    f':{self.random.randrange(256):02x}' for _ in range(3)),
+                'latency': self.latency + self.random.uniform(0, self.jitter),
+                'open': [] if dropped else [p for p in self.ports if self.random.random() < self.open_rate],
+            }
+        self._servers: List[asyncio.AbstractServer] = []
+        self._sockets: List[socket.socket] = []
+        self._state_file: Optional[str] = None
+
+    async def _answer(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        ip, port = writer.get_extra_info('sockname')[:2]
+        try:
+            await asyncio.sleep(self.state[ip]['latency'])
+            if port in BANNERS:
+                writer.write(BANNERS[port])
+            else:
+                # HTTP and everything else answers after the first request bytes
+                await asyncio.wait_for(reader.read(1), 1.0)
+                writer.write(HTTP_RESPONSE)
+            await writer.drain()
+        except (asyncio.TimeoutError, OSError):
+            pass
+        finally:
+            writer.close()
+
+    def _black_hole(self, ip: str, port: int):
+        # A listener whose accept queue is full drops every further SYN
+        listener = socket.socket()
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((ip, port))
+        listener.listen(0)
+        self._sockets.append(listener)
+        for _ in range(2):
+            filler = socket.socket()
+            filler.setblocking(False)
+            try:
+                filler.connect((ip, port))
+            except BlockingIOError:
+                pass
+            self._sockets.append(filler)
+
+    async def start(self):
+        raise_file_limit()
+        for ip, host in self.state.items():
+            if not host['alive']:
+                for port in self.ports:
+                    self._black_hole(ip, port)
+                continue
+            for port in host['open']:
+                self._servers.append(await asyncio.start_server(self._answer, ip, port, backlog=512))
+        fd, self._state_file = tempfile.mkstemp(prefix='simnet-', suffix='.json')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.state, f)
+
+    async def stop(self):
+        for server in self._servers:
+            server.close()
+        await asyncio.gather(*(server.wait_closed() for server in self._servers))
+        for sock in self._sockets:
+            sock.close()
+        self._servers, self._sockets = [], []
+        if self._state_file:
+            os.unlink(self._state_file)
+            self._state_file = None
+
+    async def __aenter__(self) -> 'SimulatedNetwork':
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    def environment(self) -> Dict[str, str]:
+        """Environment variables that put the fake binaries in front of the real ones."""
+        return {
+            'PATH': FAKEBIN + os.pathsep + os.environ.get('PATH', ''),
+            'SIMNET_STATE': self._state_file or '',
+        }
+
+    def services(self) -> List[Dict]:
+        """Configured services for every port of every host, open or not."""
+        return [{'name': f'Service {ip}:{port}', 'host': ip, 'port': port}
+                for ip in self.state for port in self.ports]
+
+    def devices(self) -> List[Dict]:
+        return [{'alias': f'Device {ip}', 'ip': ip, 'mac': host['mac']} for ip, host in self.state.items()]
+
+    def arp_table(self) -> Dict[str, str]:
+        return {ip: host['mac'] for ip, host in self.state.items() if host['alive']}
+
+    def subnet(self, prefix: int) -> str:
+        """The first subnet of the simulated network with the given prefix length."""
+        return str(next(self.network.subnets(new_prefix=prefix)))
@@ -1,20 +1,71 @@
 from pathlib import Path
+import csv
 import json
 
-input_file = Path("oui.txt")
+from oui_index import normalize_prefix, write_index
+
+# IEEE registries: MA-L (24 bit), MA-M (28 bit), MA-S (36 bit).
+# Each may be given as the .txt or the .csv download.
+input_files = [Path(name) for name in ("oui.txt", "mam.txt", "oui36.txt", "oui.csv", "mam.csv", "oui36.csv")]
 output_file = Path("oui.json")
+index_file = Path("oui.idx")
+
+# Size of the assignment block in the "(base 16)" line -> hex digits of the prefix
+block_digits = {0xFFFFFF: 6, 0xFFFFF: 7, 0xFFF: 9}
 
-oui_dict = {}
 
-for line in input_file.read_text(encoding="utf-8", errors="ignore").splitlines():
-    if "(hex)" in line:
-        parts = line.split("(hex)", 1)
-        if len(parts) == 2:
-            mac = parts[0].strip().upper()
+def parse_txt(path: Path) -> dict:
+    """Parse an IEEE .txt registry; the "(base 16)" line after each "(hex)" line
+    tells how many bits of the address the assignment covers."""
+    entries = {}
+    prefix = vendor = None
+    for line in path.read_text(encoding="utf-8", errors="ignore").splitlines():
+        if "(hex)" in line:
+            parts = line.split("(hex)", 1)
+            prefix = parts[0].strip().upper()
             vendor = parts[1].strip()
-            oui_dict[mac] = vendor
+            entries[prefix] = vendor
+        elif "(base 16)" in line and prefix:
+            block = line.split("(base 16)", 1)[0].strip()
+            start, _, end = block.partition("-")
+            try:
+                digits = block_digits.get(int(end, 16) - int(start, 16))
+            except ValueError:
+                digits = None
+            if digits and digits > 6:
+                # MA-M/MA-S share their 24-bit prefix with other vendors
+                del entries[prefix]
+                entries[prefix + "-" + start[-6:][:digits - 6].upper()] = vendor
+            prefix = None
+    return entries
+
+
+def parse_csv(path: Path) -> dict:
+    """Parse an IEEE .csv registry (Registry,Assignment,Organization Name,...)."""
+    entries = {}
+    with path.open(encoding="utf-8", errors="ignore", newline="") as f:
+        for row in csv.DictReader(f):
+            assignment = normalize_prefix(row.get("Assignment", ""))
+            vendor = (row.get("Organization Name") or "").strip()
+            if len(assignment) in (6, 7, 9) and vendor:
+                dashed = "-".join(assignment[i:i + 2] for i in range(0, 6, 2))
+                if len(assignment) > 6:
+                    dashed += "-" + assignment[6:]
+                entries[dashed] = vendor
+    return entries
+
+
+if __name__ == "__main__":
+    oui_dict = {}
+    for input_file in input_files:
+        if input_file.exists():
+            parser = parse_csv if input_file.suffix == ".csv" else parse_txt
+            oui_dict.update(parser(input_file))
+
+    with output_file.open("w", encoding="utf-8") as f:
+        json.dump(oui_dict, f, indent=2, ensure_ascii=False)
 
-with output_file.open("w", encoding="utf-8") as f:
-    json.dump(oui_dict, f, indent=2, ensure_ascii=False)
+    print(f"{len(oui_dict)} Einträge als JSON gespeichert in {output_file}")
 
-print(f"{len(oui_dict)} Einträge als JSON gespeichert in {output_file}")
+    count = write_index(oui_dict, str(index_file))
+    print(f"{count} Einträge als Index gespeichert in {index_file}")
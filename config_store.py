@@ -0,0 +1,317 @@
+import asyncio
+import logging
+import os
+import tempfile
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import yaml
+
+DEFAULT_PORTS = [80, 443, 22, 21, 25, 1433, 3306, 5432, 27017]
+
+
+def new_id() -> str:
+    """Return a new stable ID for a device or service."""
+    return uuid.uuid4().hex[:12]
+
+
+def device_key(device: Dict) -> Any:
+    return device.get('ip')
+
+
+def service_key(service: Dict) -> Any:
+    return service.get('host'), service.get('port')
+
+
+class ConfigStore:
+    """In-memory copy of config.yaml with lookup indexes and write-behind saving.
+
+    Reads are served from memory; the file is parsed again only when its
+    mtime changes on disk. Changes made inside ``transaction()`` are
+    collected and written out once per ``flush_delay`` seconds through a
+    temporary file that atomically replaces the original. ``version``
+    changes with every transaction and reload, so views derived from the
+    configuration can be cached. Bookkeeping fields set with ``stamp()``
+    are saved on the slower ``stamp_delay`` and change ``stamp_version``
+    instead, for views that show them.
+
+    Every device and service carries a stable ``id``; entries without one
+    (older files, hand edits) get one when the file is loaded.
+    """
+
+    def __init__(self, path: str = 'config.yaml', flush_delay: float = 1.0, stamp_delay: float = 300.0):
+        self.path = path
+        self.flush_delay = flush_delay
+        self.stamp_delay = stamp_delay
+        self.devices_by_ip: Dict[str, Dict] = {}
+        self.services_by_key: Dict[Tuple[str, int], Dict] = {}
+        self.devices_by_id: Dict[str, Dict] = {}
+        self.services_by_id: Dict[str, Dict] = {}
+        self.service_counts: Dict[str, int] = {}
+        self._version = 0
+        self.stamp_version = 0
+        self._lock = threading.RLock()
+        self._config: Optional[Dict] = None
+        self._mtime: Optional[int] = None
+        self._dirty = False
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+
+    def _file_mtime(self) -> Optional[int]:
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _load(self):
+        config = None
+        mtime = self._file_mtime()
+        if mtime is not None:
+            with open(self.path, 'r') as f:
+                config = yaml.safe_load(f)
+        if not config:
+            config = {}
+        # Setze Defaults, falls Keys fehlen
+        if config.get('services') is None:
+            config['services'] = []
+        if config.get('devices') is None:
+            config['devices'] = []
+        if config.get('default_ports') is None:
+            config['default_ports'] = list(DEFAULT_PORTS)
+        self._config = config
+        self._mtime = mtime
+        self._version += 1
+        # Fehlende oder doppelte IDs vergeben und speichern
+        assigned = False
+        for items in (config['devices'], config['services']):
+            seen = set()
+            for item in items:
+                if not item.get('id') or item['id'] in seen:
+                    item['id'] = new_id()
+                    assigned = True
+                seen.add(item['id'])
+        self._reindex()
+        if assigned:
+            self._schedule_flush()
+
+    def _reindex(self):
+        self.devices_by_ip = {device_key(d): d for d in self._config['devices']}
+        self.services_by_key = {service_key(s): s for s in self._config['services']}
+        self.devices_by_id = {d['id']: d for d in self._config['devices']}
+        self.services_by_id = {s['id']: s for s in self._config['services']}
+        # Anzahl der Dienste je Host für /devices
+        self.service_counts = {}
+        for host, _ in self.services_by_key:
+            self.service_counts[host] = self.service_counts.get(host, 0) + 1
+
+    def _ensure_loaded(self):
+        # Unsaved changes win over edits made to the file in the meantime
+        if self._config is None or (not self._dirty and self._file_mtime() != self._mtime):
+            self._load()
+
+    def get(self) -> Dict:
+        """Return the current configuration.
+
+        The returned dict is shared; use ``transaction()`` to change it.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            return self._config
+
+    @property
+    def version(self) -> int:
+        """Counter that changes whenever the configuration may have changed."""
+        with self._lock:
+            self._ensure_loaded()
+            return self._version
+
+    def get_device(self, ip: str) -> Optional[Dict]:
+        """Look up a device by IP address."""
+        with self._lock:
+            self._ensure_loaded()
+            return self.devices_by_ip.get(ip)
+
+    def get_service(self, host: str, port: int) -> Optional[Dict]:
+        """Look up a service by host and port."""
+        with self._lock:
+            self._ensure_loaded()
+            return self.services_by_key.get((host, port))
+
+    @contextmanager
+    def transaction(self, reindex: bool = True) -> Iterator[Dict]:
+        """Lock the configuration for modification and schedule a save afterwards.
+
+        Pass ``reindex=False`` only if the caller keeps the indexes up to date
+        itself, as the upsert methods do.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            try:
+                yield self._config
+            finally:
+                if reindex:
+                    self._reindex()
+                self._schedule_flush()
+
+    def upsert_devices(self, devices: Iterable[Dict], update: bool = False) -> Tuple[List[Dict], List[Dict]]:
+        """Add devices whose IP is not known yet.
+
+        With ``update=True`` the fields of already known devices are
+        overwritten as well. Returns the lists of added and updated devices.
+        """
+        added, updated = [], []
+        with self.transaction(reindex=False) as config:
+            for device in devices:
+                existing = self.devices_by_ip.get(device['ip'])
+                if existing is None:
+                    if not device.get('id') or device['id'] in self.devices_by_id:
+                        device['id'] = new_id()
+                    config['devices'].append(device)
+                    self.devices_by_ip[device['ip']] = device
+                    self.devices_by_id[device['id']] = device
+                    added.append(device)
+                elif update:
+                    existing.update({k: v for k, v in device.items() if k != 'id'})
+                    updated.append(existing)
+        return added, updated
+
+    def upsert_services(self, services: Iterable[Dict], update: bool = False) -> Tuple[List[Dict], List[Dict]]:
+        """Add services whose (host, port) is not known yet.
+
+        With ``update=True`` the fields of already known services are
+        overwritten as well. Returns the lists of added and updated services.
+        """
+        added, updated = [], []
+        with self.transaction(reindex=False) as config:
+            for service in services:
+                key = (service['host'], service['port'])
+                existing = self.services_by_key.get(key)
+                if existing is None:
+                    if not service.get('id') or service['id'] in self.services_by_id:
+                        service['id'] = new_id()
+                    config['services'].append(service)
+                    self.services_by_key[key] = service
+                    self.services_by_id[service['id']] = service
+                    self.service_counts[key[0]] = self.service_counts.get(key[0], 0) + 1
+                    added.append(service)
+                elif update:
+                    existing.update({k: v for k, v in service.items() if k != 'id'})
+                    updated.append(existing)
+        return added, updated
+
+    @staticmethod
+    def _plan(items: List[Dict], key: Callable[[Dict], Any], changes: Dict) -> Tuple[List[Dict], Dict]:
+        """Apply one kind of changes to a copy of ``items`` and return (new list, report)."""
+        by_id = {item['id']: item for item in items}
+        for item_id in [u['id'] for u in changes.get('update', [])] + list(changes.get('delete', [])):
+            if item_id not in by_id:
+                raise KeyError(item_id)
+        deleted_ids = set(changes.get('delete', []))
+        updates = {u['id']: u for u in changes.get('update', [])}
+        report = {'created': [], 'updated': [], 'deleted': [], 'skipped': []}
+        # Duplicates already in the file are left alone; only changed items are checked
+        keys = {key(item) for item in items if item['id'] not in deleted_ids and item['id'] not in updates}
+        result = []
+        for item in items:
+            if item['id'] in deleted_ids:
+                report['deleted'].append(item)
+                continue
+            if item['id'] in updates:
+                item = dict(item, **updates[item['id']])
+                if key(item) in keys:
+                    raise ValueError(f"Duplicate entry for {key(item)}")
+                keys.add(key(item))
+                report['updated'].append(item)
+            result.append(item)
+        for item in changes.get('create', []):
+            if key(item) in keys:
+                report['skipped'].append(item)
+                continue
+            item = dict(item, id=new_id())
+            keys.add(key(item))
+            result.append(item)
+            report['created'].append(item)
+        return result, report
+
+    def apply(self, devices: Optional[Dict] = None, services: Optional[Dict] = None) -> Dict[str, Dict]:
+        """Apply many creates, updates and deletes in one transaction.
+
+        ``devices`` and ``services`` may each hold ``create`` (new items),
+        ``update`` (items with an ``id`` whose fields are merged into the
+        stored item) and ``delete`` (IDs). Everything is checked before
+        anything changes: an unknown ID raises KeyError, an update that
+        would duplicate an IP or host/port raises ValueError. New items
+        whose IP or host/port is already known are skipped. The changes are
+        saved with a single flush; returns what was created, updated,
+        deleted and skipped per kind.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            new_devices, device_report = self._plan(self._config['devices'], device_key, devices or {})
+            new_services, service_report = self._plan(self._config['services'], service_key, services or {})
+            with self.transaction() as config:
+                config['devices'] = new_devices
+                config['services'] = new_services
+        return {'devices': device_report, 'services': service_report}
+
+    def stamp(self, item: Dict, key: str, value: Any):
+        """Set a bookkeeping field such as ``last_seen`` on a stored item.
+
+        Unlike a transaction this neither bumps ``version`` nor saves
+        within ``flush_delay``: only ``stamp_version`` changes, and the
+        value is written with the next flush, at the latest after
+        ``stamp_delay`` seconds.
+        """
+        with self._lock:
+            item[key] = value
+            self.stamp_version += 1
+            self._dirty = True
+            self._schedule_write(self.stamp_delay)
+
+    def _schedule_flush(self):
+        self._dirty = True
+        self._version += 1
+        self._schedule_write(self.flush_delay)
+
+    def _schedule_write(self, delay: float):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No event loop (scripts, shutdown): write through immediately
+            self.flush()
+            return
+        # A pending slow write is brought forward, never pushed back
+        if self._flush_handle is not None and self._flush_handle.when() > loop.time() + delay:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._flush_handle is None:
+            self._flush_handle = loop.call_later(delay, self.flush)
+
+    def flush(self):
+        """Write pending changes to disk atomically."""
+        with self._lock:
+            if self._flush_handle is not None:
+                self._flush_handle.cancel()
+                self._flush_handle = None
+            if not self._dirty:
+                return
+            directory = os.path.dirname(os.path.abspath(self.path))
+            fd, tmp_path = tempfile.mkstemp(prefix='.config-', suffix='.yaml', dir=directory)
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    yaml.dump(self._config, f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                if os.path.exists(self.path):
+                    os.chmod(tmp_path, os.stat(self.path).st_mode & 0o777)
+                os.replace(tmp_path, self.path)
+            except Exception as e:
+                logging.error(f"Error saving config to {self.path}: {e}")
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+                return
+            self._mtime = self._file_mtime()
+            self._dirty = False
@@ -0,0 +1,161 @@
+import asyncio
+import os
+import random
+import socket
+import struct
+from typing import Dict, Iterable, Optional, Set
+
+import metrics
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+
+
+def read_neighbor_table(path: str = '/proc/net/arp') -> Dict[str, str]:
+    """Read the kernel neighbor table in one pass and return IP -> MAC.
+
+    Incomplete entries (no MAC resolved yet) are skipped. Returns an empty
+    dict if the table is not available.
+    """
+    table = {}
+    try:
+        with open(path, 'r') as f:
+            next(f, None)  # header line
+            for line in f:
+                parts = line.split()
+                # IP address, HW type, Flags, HW address, Mask, Device
+                if len(parts) < 4 or parts[2] == '0x0' or parts[3] == '00:00:00:00:00:00':
+                    continue
+                table[parts[0]] = parts[3]
+    except OSError:
+        pass
+    return table
+
+
+def _checksum(data: bytes) -> int:
+    if len(data) % 2:
+        data += b'\0'
+    total = sum(struct.unpack(f'!{len(data) // 2}H', data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def _echo_request(ident: int, seq: int) -> bytes:
+    payload = b'HomeNetSupervise'
+    header = struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, 0, ident, seq)
+    checksum = _checksum(header + payload)
+    return struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, checksum, ident, seq) + payload
+
+
+def open_icmp_socket() -> socket.socket:
+    """Open an ICMP socket, preferring the unprivileged datagram kind.
+
+    Datagram ICMP sockets need the process group to be in
+    net.ipv4.ping_group_range, raw sockets need CAP_NET_RAW. Raises
+    PermissionError if neither is allowed.
+    """
+    for sock_type in (socket.SOCK_DGRAM, socket.SOCK_RAW):
+        try:
+            sock = socket.socket(socket.AF_INET, sock_type, socket.IPPROTO_ICMP)
+        except OSError:
+            continue
+        sock.setblocking(False)
+        return sock
+    raise PermissionError("No permission to open an ICMP socket")
+
+
+class IcmpSweeper:
+    """Ping many hosts at once over a single ICMP socket."""
+
+    def __init__(self, timeout: float = 1.0, rate: int = 2000, retries: int = 1):
+        self.timeout = timeout
+        self.rate = max(1, rate)
+        self.retries = retries
+
+    async def _send_all(self, sock: socket.socket, hosts: Iterable[str], ident: int, seq: int,
+                        sent: Dict[str, float]):
+        loop = asyncio.get_running_loop()
+        batch = max(1, self.rate // 100)
+        for count, host in enumerate(hosts, 1):
+            packet = _echo_request(ident, seq)
+            while True:
+                try:
+                    sock.sendto(packet, (host, 0))
+                    sent[host] = loop.time()
+                    break
+                except BlockingIOError:
+                    await asyncio.sleep(0.001)
+                except OSError:
+                    # Unreachable network, broadcast address etc.
+                    break
+            if count % batch == 0:
+                await asyncio.sleep(0.01)
+
+    async def sweep(self, hosts: Iterable[str]) -> Set[str]:
+        """Return the subset of hosts that answered an echo request."""
+        targets = set(hosts)
+        alive: Set[str] = set()
+        if not targets:
+            return alive
+        sock = open_icmp_socket()
+        raw = sock.type == socket.SOCK_RAW
+        ident = random.randint(0, 0xFFFF)
+        loop = asyncio.get_running_loop()
+        all_found = loop.create_future()
+        sent: Dict[str, float] = {}
+        rtt = metrics.ping_seconds.labels('icmp')
+
+        def on_readable():
+            while True:
+                try:
+                    data, (addr, _) = sock.recvfrom(2048)
+                except (BlockingIOError, InterruptedError):
+                    return
+                except OSError:
+                    continue
+                if raw:
+                    # Raw sockets deliver the IP header and every ICMP packet
+                    data = data[(data[0] & 0x0F) * 4:]
+                if len(data) < 8 or data[0] != ICMP_ECHO_REPLY:
+                    continue
+                if raw and struct.unpack('!H', data[4:6])[0] != ident:
+                    continue
+                if addr in targets and addr not in alive:
+                    alive.add(addr)
+                    if addr in sent:
+                        rtt.observe(loop.time() - sent[addr])
+                    if len(alive) == len(targets) and not all_found.done():
+                        all_found.set_result(None)
+
+        loop.add_reader(sock.fileno(), on_readable)
+        try:
+            for seq in range(self.retries + 1):
+                pending = [host for host in targets if host not in alive]
+                if not pending:
+                    break
+                await self._send_all(sock, pending, ident, seq, sent)
+                try:
+                    await asyncio.wait_for(asyncio.shield(all_found), self.timeout)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            loop.remove_reader(sock.fileno())
+            sock.close()
+        metrics.pings_total.labels('icmp', 'up').inc(len(alive))
+        metrics.pings_total.labels('icmp', 'down').inc(len(targets) - len(alive))
+        return alive
+
+
+async def sweep_hosts(hosts: Iterable[str], timeout: float = 1.0, rate: int = 2000) -> Optional[Set[str]]:
+    """Ping all hosts over one ICMP socket.
+
+    Returns None if ICMP sockets are not permitted, so the caller can fall
+    back to spawning ``ping`` per host.
+    """
+    if os.name != 'posix':
+        return None
+    try:
+        return await IcmpSweeper(timeout=timeout, rate=rate).sweep(hosts)
+    except PermissionError:
+        return None
@@ -0,0 +1,51 @@
+import asyncio
+import json
+from typing import Dict, Optional, Set
+
+
+def format_sse(event_type: str, data) -> str:
+    """Encode one Server-Sent Event."""
+    return f"event: {event_type}\ndata: {json.dumps(data)}\n\n"
+
+
+class EventBus:
+    """Fan out state changes to all connected push clients.
+
+    Each subscriber gets a bounded queue. A client that falls so far behind
+    that its queue overflows is dropped; browsers reconnect automatically
+    and start again from a fresh snapshot.
+    """
+
+    def __init__(self, queue_size: int = 256):
+        self.queue_size = queue_size
+        self._subscribers: Set[asyncio.Queue] = set()
+
+    def __len__(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def publish(self, event_type: str, data: Dict):
+        """Queue an event for every subscriber without waiting."""
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait((event_type, data))
+            except asyncio.QueueFull:
+                # Tell the client to reconnect, it will get a new snapshot
+                self._subscribers.discard(queue)
+                queue.get_nowait()
+                queue.put_nowait(None)
+
+    async def next(self, queue: asyncio.Queue, keepalive: float = 15.0) -> Optional[tuple]:
+        """Wait for the next event; returns ("", {}) after ``keepalive`` seconds
+        without one and None once the subscriber has been dropped."""
+        try:
+            return await asyncio.wait_for(queue.get(), keepalive)
+        except asyncio.TimeoutError:
+            return "", {}
@@ -0,0 +1,144 @@
+import asyncio
+import ipaddress
+import socket
+import ssl
+from typing import Dict, Optional
+
+# Ports that speak TLS right after connecting / plain HTTP
+TLS_PORTS = {443, 465, 636, 853, 993, 995, 5001, 8006, 8443, 9443}
+HTTP_PORTS = {80, 3000, 5000, 8000, 8008, 8080, 8081, 8123, 8888, 9000, 9090, 32400}
+
+CN_OID = b'\x06\x03\x55\x04\x03'  # 2.5.4.3 commonName
+
+
+def _tls_context() -> ssl.SSLContext:
+    # Only the certificate is read, it is never trusted
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context
+
+
+def certificate_cn(der: bytes) -> Optional[str]:
+    """Extract the subject common name from a DER encoded certificate.
+
+    The issuer name comes before the subject in the certificate, so the
+    last commonName attribute is the subject's.
+    """
+    pos = der.rfind(CN_OID)
+    if pos < 0:
+        return None
+    pos += len(CN_OID) + 1  # skip the string type tag
+    if pos >= len(der):
+        return None
+    length = der[pos]
+    pos += 1
+    if length & 0x80:
+        size = length & 0x7F
+        length = int.from_bytes(der[pos:pos + size], 'big')
+        pos += size
+    return der[pos:pos + length].decode('utf-8', errors='replace') or None
+
+
+def _first_line(data: bytes, limit: int = 120) -> str:
+    line = data.split(b'\n', 1)[0].strip()
+    return line.decode('latin-1')[:limit]
+
+
+def _parse_banner(data: bytes, result: Dict):
+    if data.startswith(b'HTTP/'):
+        result['protocol'] = 'http' if result['protocol'] != 'https' else 'https'
+        result['banner'] = _first_line(data)
+        for line in data.split(b'\r\n')[1:]:
+            name, _, value = line.partition(b':')
+            if name.strip().lower() == b'server':
+                result['server'] = value.strip().decode('latin-1')[:120]
+                break
+    elif data.startswith(b'SSH-'):
+        result['protocol'] = 'ssh'
+        result['banner'] = _first_line(data)
+    elif data:
+        if data.startswith(b'220') and b'FTP' in data.upper():
+            result['protocol'] = 'ftp'
+        elif data.startswith(b'220') and (b'SMTP' in data.upper() or b'ESMTP' in data.upper()):
+            result['protocol'] = 'smtp'
+        result['banner'] = _first_line(data)
+
+
+async def probe_service(host: str, port: int, timeout: float = 1.0,
+                        max_bytes: int = 256, read_timeout: float = 0.5) -> Dict:
+    """Connect to a port, measure the connect RTT and identify what listens.
+
+    TLS ports get a handshake (the certificate CN is reported), HTTP ports a
+    ``HEAD`` request, all others are only read from, which is enough for
+    protocols that greet first such as SSH, FTP and SMTP. At most
+    ``max_bytes`` are read, and the whole probe takes at most about
+    ``timeout + 2 * read_timeout`` seconds.
+
+    Returns a dict with ``open``, ``latency_ms``, ``protocol``, ``banner``,
+    ``server`` and ``tls_cn`` (the last four None if unknown).
+    """
+    result = {'open': False, 'latency_ms': None, 'protocol': None,
+              'banner': None, 'server': None, 'tls_cn': None}
+    loop = asyncio.get_running_loop()
+    try:
+        infos = await asyncio.wait_for(
+            loop.getaddrinfo(host, port, type=socket.SOCK_STREAM), timeout)
+        family, sock_type, proto, _, address = infos[0]
+    except (asyncio.TimeoutError, OSError):
+        return result
+    sock = socket.socket(family, sock_type, proto)
+    sock.setblocking(False)
+    writer = None
+    try:
+        started = loop.time()
+        try:
+            await asyncio.wait_for(loop.sock_connect(sock, address), timeout)
+        except (asyncio.TimeoutError, OSError):
+            return result
+        result['open'] = True
+        result['latency_ms'] = round((loop.time() - started) * 1000, 2)
+
+        if port in TLS_PORTS:
+            try:
+                ipaddress.ip_address(host)
+                server_hostname = ''  # no SNI for IP literals
+            except ValueError:
+                server_hostname = host
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(
+                sock=sock, ssl=_tls_context(), server_hostname=server_hostname), read_timeout)
+            result['protocol'] = 'tls'
+            der = writer.get_extra_info('ssl_object').getpeercert(binary_form=True)
+            if der:
+                result['tls_cn'] = certificate_cn(der)
+        else:
+            reader, writer = await asyncio.open_connection(sock=sock)
+
+        if port in HTTP_PORTS or port in (443, 8443):
+            if result['protocol'] == 'tls':
+                result['protocol'] = 'https'
+            writer.write(f"HEAD / HTTP/1.0\r\nHost: {host}\r\n\r\n".encode())
+        data = await asyncio.wait_for(reader.read(max_bytes), read_timeout)
+        _parse_banner(data, result)
+    except (asyncio.TimeoutError, OSError, ssl.SSLError, ValueError):
+        pass
+    finally:
+        if writer is not None:
+            writer.close()
+        else:
+            sock.close()
+    return result
+
+
+def describe_service(fingerprint: Dict) -> Optional[str]:
+    """Build a readable service name from a probe_service result, if possible."""
+    protocol = fingerprint.get('protocol')
+    detail = fingerprint.get('server') or fingerprint.get('tls_cn')
+    if protocol == 'ssh' and fingerprint.get('banner'):
+        detail = fingerprint['banner'].split('-', 2)[-1]
+    elif protocol in ('ftp', 'smtp') and fingerprint.get('banner'):
+        detail = fingerprint['banner'][4:60].strip() or None
+    if not protocol:
+        return None
+    name = protocol.upper()
+    return f"{name} ({detail})" if detail else name
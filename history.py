@@ -0,0 +1,177 @@
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+# Name, bucket size in seconds
+ROLLUPS = (('rollup_1m', 60), ('rollup_1h', 3600))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    host TEXT NOT NULL,
+    port INTEGER NOT NULL,
+    ts INTEGER NOT NULL,
+    open INTEGER NOT NULL,
+    latency REAL
+);
+CREATE INDEX IF NOT EXISTS samples_service_ts ON samples (host, port, ts);
+"""
+
+ROLLUP_SCHEMA = """
+CREATE TABLE IF NOT EXISTS {table} (
+    host TEXT NOT NULL,
+    port INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    samples INTEGER NOT NULL,
+    up INTEGER NOT NULL,
+    latency_sum REAL NOT NULL,
+    latency_count INTEGER NOT NULL,
+    latency_min REAL,
+    latency_max REAL,
+    PRIMARY KEY (host, port, bucket)
+) WITHOUT ROWID;
+"""
+
+ROLLUP_UPSERT = """
+INSERT INTO {table} VALUES (?, ?, ?, 1, ?, ?, ?, ?, ?)
+ON CONFLICT (host, port, bucket) DO UPDATE SET
+    samples = samples + 1,
+    up = up + excluded.up,
+    latency_sum = latency_sum + excluded.latency_sum,
+    latency_count = latency_count + excluded.latency_count,
+    latency_min = MIN(COALESCE(latency_min, excluded.latency_min), COALESCE(excluded.latency_min, latency_min)),
+    latency_max = MAX(COALESCE(latency_max, excluded.latency_max), COALESCE(excluded.latency_max, latency_max))
+"""
+
+
+class HistoryStore:
+    """Up/down and latency history of all services in an SQLite file.
+
+    Every probe result is kept as a raw sample and added to 1-minute and
+    1-hour aggregates at the same time, so range queries over long periods
+    only read the small hourly table. Raw samples and minute aggregates are
+    dropped after their retention period; hourly aggregates are kept.
+
+    The database runs in WAL mode; the methods are blocking and meant to be
+    called through ``run_in_executor``.
+    """
+
+    def __init__(self, path: str = 'history.db', raw_retention: float = 2 * 86400,
+                 minute_retention: float = 30 * 86400, compact_interval: float = 3600):
+        self.path = path
+        self.raw_retention = raw_retention
+        self.minute_retention = minute_retention
+        self.compact_interval = compact_interval
+        self._last_compact = 0.0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        with self._db:
+            self._db.executescript(SCHEMA)
+            for table, _ in ROLLUPS:
+                self._db.executescript(ROLLUP_SCHEMA.format(table=table))
+
+    def record(self, results: List[Dict], ts: Optional[float] = None):
+        """Store the results of one check_services run."""
+        ts = int(ts if ts is not None else time.time())
+        rows = []
+        for result in results:
+            if result.get('port_open') is None:
+                continue  # not checked in time: neither up nor down
+            latency = result.get('latency_ms') if result.get('port_open') else None
+            rows.append((result['host'], result['port'], int(bool(result.get('port_open'))), latency))
+        with self._lock, self._db:
+            self._db.executemany(
+                'INSERT INTO samples VALUES (?, ?, ?, ?, ?)',
+                [(host, port, ts, up, latency) for host, port, up, latency in rows]
+            )
+            for table, size in ROLLUPS:
+                bucket = ts - ts % size
+                self._db.executemany(ROLLUP_UPSERT.format(table=table), [
+                    (host, port, bucket, up, latency or 0.0, int(latency is not None), latency, latency)
+                    for host, port, up, latency in rows
+                ])
+        if ts - self._last_compact >= self.compact_interval:
+            self.compact(ts)
+
+    def compact(self, now: Optional[float] = None):
+        """Drop raw samples and minute aggregates past their retention."""
+        now = int(now if now is not None else time.time())
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM samples WHERE ts < ?', (now - self.raw_retention,))
+            self._db.execute('DELETE FROM rollup_1m WHERE bucket < ?', (now - self.minute_retention,))
+        self._last_compact = now
+
+    def _resolution(self, start: float, end: float) -> str:
+        span = end - start
+        if span <= 6 * 3600 and start >= time.time() - self.raw_retention:
+            return 'raw'
+        if span <= 7 * 86400 and start >= time.time() - self.minute_retention:
+            return '1m'
+        return '1h'
+
+    def query(self, host: str, port: int, start: float, end: float,
+              resolution: Optional[str] = None) -> Dict:
+        """Return the history of one service between two Unix timestamps.
+
+        ``resolution`` is ``raw``, ``1m`` or ``1h``; by default the finest one
+        that still holds data for the whole range and keeps the answer small.
+        """
+        resolution = resolution or self._resolution(start, end)
+        if resolution not in ('raw', '1m', '1h'):
+            raise ValueError(f"Unknown resolution: {resolution}")
+        with self._lock:
+            if resolution == 'raw':
+                rows = self._db.execute(
+                    'SELECT ts, 1, open, COALESCE(latency, 0), latency IS NOT NULL, latency, latency '
+                    'FROM samples WHERE host = ? AND port = ? AND ts BETWEEN ? AND ? ORDER BY ts',
+                    (host, port, int(start), int(end))
+                ).fetchall()
+            else:
+                table, size = dict(zip(('1m', '1h'), ROLLUPS))[resolution]
+                rows = self._db.execute(
+                    f'SELECT bucket, samples, up, latency_sum, latency_count, latency_min, latency_max '
+                    f'FROM {table} WHERE host = ? AND port = ? AND bucket BETWEEN ? AND ? ORDER BY bucket',
+                    (host, port, int(start) - int(start) % size, int(end))
+                ).fetchall()
+        points = []
+        total = up_total = 0
+        for ts, samples, up, latency_sum, latency_count, latency_min, latency_max in rows:
+            total += samples
+            up_total += up
+            points.append({
+                'ts': ts,
+                'samples': samples,
+                'uptime': round(up / samples * 100, 2),
+                'latency_avg': round(latency_sum / latency_count, 2) if latency_count else None,
+                'latency_min': latency_min,
+                'latency_max': latency_max
+            })
+        return {
+            'host': host,
+            'port': port,
+            'resolution': resolution,
+            'uptime': round(up_total / total * 100, 2) if total else None,
+            'points': points
+        }
+
+    def summary(self, start: float, end: float) -> List[Dict]:
+        """Return uptime and average latency of every service over a range."""
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT host, port, SUM(samples), SUM(up), SUM(latency_sum), SUM(latency_count) '
+                'FROM rollup_1h WHERE bucket BETWEEN ? AND ? GROUP BY host, port',
+                (int(start - start % 3600), int(end))
+            ).fetchall()
+        return [{
+            'host': host,
+            'port': port,
+            'samples': samples,
+            'uptime': round(up / samples * 100, 2),
+            'latency_avg': round(latency_sum / latency_count, 2) if latency_count else None
+        } for host, port, samples, up, latency_sum, latency_count in rows]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
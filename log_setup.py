@@ -0,0 +1,75 @@
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+from typing import Optional
+
+LOG_FORMAT = '%(asctime)s %(levelname)s %(message)s'
+
+
+class StructuredFormatter(logging.Formatter):
+    """Format records as text with ``key=value`` pairs or as JSON lines.
+
+    Structured data is passed with ``extra={'fields': {...}}``; the message
+    itself stays a short, lazily formatted text.
+    """
+
+    def __init__(self, json_lines: bool = False):
+        super().__init__(LOG_FORMAT)
+        self.json_lines = json_lines
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = getattr(record, 'fields', None) or {}
+        if self.json_lines:
+            entry = {
+                'time': self.formatTime(record),
+                'level': record.levelname,
+                'logger': record.name,
+                'message': record.getMessage(),
+                **fields
+            }
+            if record.exc_info:
+                entry['exception'] = self.formatException(record.exc_info)
+            return json.dumps(entry, default=str)
+        message = super().format(record)
+        if fields:
+            message += ' ' + ' '.join(f'{key}={value}' for key, value in fields.items())
+        return message
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queue records so the listener thread does the formatting.
+
+    The stock ``prepare`` formats the whole record, traceback included, on
+    the calling thread and drops ``exc_info``. Only the message is merged
+    here, because its arguments (devices, tables) may change on the loop
+    before the listener gets to them; tracebacks are formatted later.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def setup_logging(level: str = 'INFO', json_lines: bool = False,
+                  handler: Optional[logging.Handler] = None) -> logging.handlers.QueueListener:
+    """Route all log records through a queue to a writer thread.
+
+    Logging calls on the event loop only put the record into the queue;
+    formatting and writing happen in the listener thread. Returns the
+    started listener, stop it on shutdown to flush the remaining records.
+    """
+    handler = handler or logging.StreamHandler()
+    handler.setFormatter(StructuredFormatter(json_lines))
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for old in list(root.handlers):
+        root.removeHandler(old)
+    root.addHandler(_DeferredQueueHandler(records))
+    root.setLevel(level.upper())
+    listener = logging.handlers.QueueListener(records, handler, respect_handler_level=True)
+    listener.start()
+    return listener
@@ -0,0 +1,213 @@
+"""Counters, gauges and histograms in the Prometheus text format.
+
+Updates are plain attribute and list operations without locks: all hot
+paths run on the event loop, and a lost increment from another thread
+would only make a statistic slightly off.
+"""
+import bisect
+import math
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Seconds; covers LAN round trips up to the slowest timeouts
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _format_value(value: float) -> str:
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+class _Value:
+    __slots__ = ('value', 'function')
+
+    def __init__(self):
+        self.value = 0.0
+        self.function: Optional[Callable[[], float]] = None
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+    def set_function(self, function: Callable[[], float]):
+        """Read the value from ``function`` whenever the metrics are scraped."""
+        self.function = function
+
+    def get(self) -> float:
+        return float(self.function()) if self.function is not None else self.value
+
+
+class _Buckets:
+    __slots__ = ('bounds', 'counts', 'sum')
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class Metric:
+    """Base class: a named metric with optional labels.
+
+    ``labels(...)`` returns the child for one combination of label values;
+    metrics without labels can be updated directly.
+    """
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 registry: Optional['Registry'] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _new_child(self):
+        return _Value()
+
+    def labels(self, *values, **kwargs):
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _label_text(self, key: Tuple[str, ...], extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+        pairs = tuple(zip(self.labelnames, key)) + extra
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+    def _samples(self, key, child) -> List[str]:
+        return [f'{self.name}{self._label_text(key)} {_format_value(child.get())}']
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for key, child in list(self._children.items()):
+            lines.extend(self._samples(key, child))
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1.0):
+        self._children[()].inc(amount)
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def inc(self, amount: float = 1.0):
+        self._children[()].inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self._children[()].dec(amount)
+
+    def set(self, value: float):
+        self._children[()].set(value)
+
+    def set_function(self, function: Callable[[], float]):
+        self._children[()].set_function(function)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS, registry: Optional['Registry'] = None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _Buckets(self.buckets)
+
+    def observe(self, value: float):
+        self._children[()].observe(value)
+
+    def _samples(self, key, child) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), child.counts):
+            cumulative += count
+            le = (('le', _format_value(float(bound))),)
+            lines.append(f'{self.name}_bucket{self._label_text(key, le)} {cumulative}')
+        lines.append(f'{self.name}_sum{self._label_text(key)} {_format_value(child.sum)}')
+        lines.append(f'{self.name}_count{self._label_text(key)} {cumulative}')
+        return lines
+
+
+class Registry:
+    """Collection of metrics rendered together by ``/metrics``."""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# Scanner
+port_check_seconds = Histogram(
+    'hns_port_check_seconds', 'Time until a TCP connect was accepted, refused or gave up.', ['result'])
+probes_total = Counter(
+    'hns_probes_total', 'Port probes by result (open, refused, timeout, error).', ['result'])
+probes_in_flight = Gauge('hns_probes_in_flight', 'TCP connects in progress.')
+probes_waiting = Gauge('hns_probes_waiting', 'Port probes waiting for a socket, host slot or rate token.')
+ping_seconds = Histogram(
+    'hns_ping_seconds', 'Round-trip time of answered pings by method (icmp, subprocess).', ['method'])
+pings_total = Counter('hns_pings_total', 'Pings by method and result (up, down).', ['method', 'result'])
+arp_scan_seconds = Histogram(
+    'hns_arp_scan_seconds', 'Duration of arp-scan runs by result (ok, error).', ['result'],
+    buckets=DURATION_BUCKETS)
+passive_observations_total = Counter(
+    'hns_passive_observations_total',
+    'Addresses seen by passive discovery by source (neighbors, dhcp, mdns, ssdp, arp).', ['source'])
+
+# Background work
+status_check_seconds = Histogram(
+    'hns_status_check_seconds', 'Duration of one check of all configured services.', buckets=DURATION_BUCKETS)
+autoscan_seconds = Histogram(
+    'hns_autoscan_seconds', 'Duration of autoscans by mode (full, delta).', ['mode'], buckets=DURATION_BUCKETS)
+
+# HTTP
+http_request_seconds = Histogram(
+    'hns_http_request_seconds', 'Time until the response headers were ready, by endpoint.',
+    ['method', 'route', 'status'], buckets=DURATION_BUCKETS)
+http_requests_in_flight = Gauge('hns_http_requests_in_flight', 'HTTP requests being handled.')
@@ -0,0 +1,157 @@
+"""Compact, memory-mapped OUI vendor index.
+
+The index file holds three sorted key tables, one per IEEE assignment size
+(MA-L: 24 bit, MA-M: 28 bit, MA-S: 36 bit), each paired with a table of
+vendor numbers, followed by a deduplicated vendor string table. Lookups
+binary-search the mapped file directly, so nothing is parsed at startup and
+the pages are shared between worker processes.
+
+Layout (all integers little-endian)::
+
+    header   magic "OUIX", u16 version, u16 reserved,
+             u32 count_24, u32 count_28, u32 count_36, u32 vendor_count
+    keys_24  u32[count_24]    vendor_24  u32[count_24]
+    keys_28  u32[count_28]    vendor_28  u32[count_28]
+    keys_36  u64[count_36]    vendor_36  u32[count_36]
+    offsets  u32[vendor_count + 1]
+    strings  utf-8 bytes, vendor i is strings[offsets[i]:offsets[i + 1]]
+"""
+import json
+import mmap
+import os
+import struct
+from typing import Dict, List, Optional, Tuple
+
+MAGIC = b'OUIX'
+VERSION = 1
+HEADER = struct.Struct('<4sHHIIII')
+# (hex digits, bits, key format) per assignment size, most specific first
+PREFIX_SIZES = ((9, 36, 'Q'), (7, 28, 'I'), (6, 24, 'I'))
+
+
+def normalize_prefix(prefix: str) -> str:
+    """Strip separators from a MAC prefix and upper-case it."""
+    return prefix.replace('-', '').replace(':', '').replace('.', '').strip().upper()
+
+
+def write_index(entries: Dict[str, str], path: str) -> int:
+    """Write a vendor index for ``{hex prefix: vendor}`` entries.
+
+    Prefixes must be 6, 7 or 9 hex digits long (separators are ignored);
+    anything else is skipped. Returns the number of indexed prefixes.
+    """
+    vendors: List[str] = []
+    vendor_ids: Dict[str, int] = {}
+    tables: Dict[int, List[Tuple[int, int]]] = {6: [], 7: [], 9: []}
+    for prefix, vendor in entries.items():
+        digits = normalize_prefix(prefix)
+        if len(digits) not in tables:
+            continue
+        try:
+            key = int(digits, 16)
+        except ValueError:
+            continue
+        if vendor not in vendor_ids:
+            vendor_ids[vendor] = len(vendors)
+            vendors.append(vendor)
+        tables[len(digits)].append((key, vendor_ids[vendor]))
+
+    # Later entries for the same prefix win
+    sorted_tables = {digits: sorted(dict(table).items()) for digits, table in tables.items()}
+    encoded = [v.encode('utf-8') for v in vendors]
+    offsets = [0]
+    for raw in encoded:
+        offsets.append(offsets[-1] + len(raw))
+
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, 0, len(sorted_tables[6]), len(sorted_tables[7]),
+                            len(sorted_tables[9]), len(vendors)))
+        for digits, _bits, key_format in reversed(PREFIX_SIZES):
+            table = sorted_tables[digits]
+            f.write(struct.pack(f'<{len(table)}{key_format}', *(k for k, _ in table)))
+            f.write(struct.pack(f'<{len(table)}I', *(v for _, v in table)))
+        f.write(struct.pack(f'<{len(offsets)}I', *offsets))
+        f.write(b''.join(encoded))
+    os.replace(tmp_path, path)
+    return sum(len(table) for table in sorted_tables.values())
+
+
+def build_from_json(json_path: str, index_path: str) -> int:
+    """Convert an oui.json file (``{"28-6F-B9": "Vendor", ...}``) into an index."""
+    with open(json_path, 'r', encoding='utf-8') as f:
+        return write_index(json.load(f), index_path)
+
+
+class _Table:
+    """One sorted key table plus its vendor numbers inside the mapped file."""
+
+    def __init__(self, buf, offset: int, count: int, key_format: str):
+        self.buf = buf
+        self.count = count
+        self.key = struct.Struct('<' + key_format)
+        self.keys_at = offset
+        self.vendors_at = offset + count * self.key.size
+        self.end = self.vendors_at + count * 4
+
+    def find(self, key: int) -> Optional[int]:
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            value = self.key.unpack_from(self.buf, self.keys_at + mid * self.key.size)[0]
+            if value < key:
+                lo = mid + 1
+            elif value > key:
+                hi = mid
+            else:
+                return struct.unpack_from('<I', self.buf, self.vendors_at + mid * 4)[0]
+        return None
+
+
+class OuiIndex:
+    """Read-only view of an index file written by ``write_index``."""
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, count_24, count_28, count_36, vendor_count = \
+            HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a version {VERSION} OUI index")
+        counts = {24: count_24, 28: count_28, 36: count_36}
+        offset = HEADER.size
+        tables = {}
+        for digits, bits, key_format in reversed(PREFIX_SIZES):
+            tables[digits] = _Table(self._mmap, offset, counts[bits], key_format)
+            offset = tables[digits].end
+        # Longest (most specific) assignment first
+        self._tables = [(digits, tables[digits]) for digits, _, _ in PREFIX_SIZES]
+        self._vendor_count = vendor_count
+        self._offsets_at = offset
+        self._strings_at = offset + (vendor_count + 1) * 4
+
+    def __len__(self) -> int:
+        return sum(table.count for _, table in self._tables)
+
+    def _vendor(self, vendor_id: int) -> str:
+        start, end = struct.unpack_from('<II', self._mmap, self._offsets_at + vendor_id * 4)
+        return self._mmap[self._strings_at + start:self._strings_at + end].decode('utf-8')
+
+    def lookup(self, mac: str) -> str:
+        """Return the vendor for a MAC address, or "" if it is not assigned."""
+        digits = normalize_prefix(mac)
+        for length, table in self._tables:
+            if len(digits) < length or not table.count:
+                continue
+            try:
+                key = int(digits[:length], 16)
+            except ValueError:
+                return ""
+            vendor_id = table.find(key)
+            if vendor_id is not None:
+                return self._vendor(vendor_id)
+        return ""
+
+    def close(self):
+        self._mmap.close()
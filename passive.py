@@ -0,0 +1,452 @@
+"""Find devices passively from the neighbor table, DHCP, mDNS and SSDP.
+
+Nothing is sent to the network. The sources are:
+
+- ``neighbors``: the kernel neighbor table over netlink (every host this
+  machine talks to or hears ARP from), dumped once at start and then
+  followed as it changes
+- ``dhcp`` (opt-in): DHCP requests broadcast to port 67 (client MAC,
+  requested address and hostname)
+- ``mdns``: mDNS traffic on 224.0.0.251:5353 (``<name>.local`` A records)
+- ``ssdp``: SSDP announcements and searches on 239.255.255.250:1900
+
+Each source turns what it sees into observations
+``{"ip": ..., "mac": ..., "hostname": ..., "source": ...}``, and
+``PassiveDiscovery`` reports the ones that tell something new. The same
+parsers read Ethernet frames from a pcap capture, so a recorded capture
+can be replayed without a network:
+
+    python passive.py replay capture.pcap
+    python passive.py listen --sources neighbors,mdns
+"""
+import argparse
+import asyncio
+import json
+import logging
+import socket
+import struct
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import metrics
+
+SOURCES = ('neighbors', 'dhcp', 'mdns', 'ssdp')
+# dhcp only on request: port 67 belongs to a DHCP server, if one runs here
+DEFAULT_SOURCES = ('neighbors', 'mdns', 'ssdp')
+
+# Netlink (linux/rtnetlink.h, linux/neighbour.h)
+RTM_NEWNEIGH = 28
+RTM_GETNEIGH = 30
+RTMGRP_NEIGH = 4
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+NDA_DST = 1
+NDA_LLADDR = 2
+# REACHABLE, STALE, DELAY, PROBE, PERMANENT: the MAC is known
+NUD_VALID = 0x02 | 0x04 | 0x08 | 0x10 | 0x80
+NLMSG_HEADER = struct.Struct('=IHHII')
+NDMSG = struct.Struct('=BBHiHBB')
+
+# Port and multicast group per UDP source
+LISTENERS = {
+    'dhcp': (67, None),
+    'mdns': (5353, '224.0.0.251'),
+    'ssdp': (1900, '239.255.255.250'),
+}
+
+DHCP_MAGIC = b'\x63\x82\x53\x63'
+DHCPACK = 5
+DHCPDECLINE = 4
+DHCPRELEASE = 7
+DNS_TYPE_A = 1
+
+ETH_P_IP = 0x0800
+ETH_P_ARP = 0x0806
+ETH_P_8021Q = 0x8100
+LINKTYPE_ETHERNET = 1
+LINKTYPE_LINUX_SLL = 113
+PCAP_MAGIC = {
+    b'\xd4\xc3\xb2\xa1': ('<', 1e6),
+    b'\xa1\xb2\xc3\xd4': ('>', 1e6),
+    b'\x4d\x3c\xb2\xa1': ('<', 1e9),
+    b'\xa1\xb2\x3c\x4d': ('>', 1e9),
+}
+
+Observation = Dict[str, Optional[str]]
+
+
+def _mac(raw: bytes) -> str:
+    return ':'.join(f'{b:02x}' for b in raw)
+
+
+def _observation(ip: str, mac: Optional[str], source: str, hostname: Optional[str] = None) -> Observation:
+    return {'ip': ip, 'mac': mac, 'hostname': hostname, 'source': source}
+
+
+def parse_neighbor_messages(data: bytes) -> List[Observation]:
+    """Parse netlink RTM_NEWNEIGH messages into observations.
+
+    Only IPv4 entries with a resolved MAC are returned; incomplete and
+    failed entries are skipped.
+    """
+    observations = []
+    offset = 0
+    while offset + NLMSG_HEADER.size <= len(data):
+        length, msg_type = NLMSG_HEADER.unpack_from(data, offset)[:2]
+        if length < NLMSG_HEADER.size or offset + length > len(data):
+            break
+        if msg_type == RTM_NEWNEIGH and length >= NLMSG_HEADER.size + NDMSG.size:
+            family, _, _, _, state, _, _ = NDMSG.unpack_from(data, offset + NLMSG_HEADER.size)
+            if family == socket.AF_INET and state & NUD_VALID:
+                attrs = {}
+                pos = offset + NLMSG_HEADER.size + NDMSG.size
+                while pos + 4 <= offset + length:
+                    attr_len, attr_type = struct.unpack_from('=HH', data, pos)
+                    if attr_len < 4:
+                        break
+                    attrs[attr_type] = data[pos + 4:pos + attr_len]
+                    pos += (attr_len + 3) & ~3
+                dst, lladdr = attrs.get(NDA_DST), attrs.get(NDA_LLADDR)
+                if dst is not None and len(dst) == 4 and lladdr is not None and len(lladdr) == 6 \
+                        and lladdr != b'\0' * 6:
+                    observations.append(_observation(socket.inet_ntoa(dst), _mac(lladdr), 'neighbors'))
+        offset += (length + 3) & ~3
+    return observations
+
+
+def _dhcp_options(data: bytes) -> Dict[int, bytes]:
+    options = {}
+    i = 0
+    while i < len(data):
+        code = data[i]
+        if code == 255:
+            break
+        if code == 0:
+            i += 1
+            continue
+        length = data[i + 1]
+        options[code] = data[i + 2:i + 2 + length]
+        i += 2 + length
+    return options
+
+
+def parse_dhcp(data: bytes) -> List[Observation]:
+    """Read client MAC, address and hostname from a DHCP request or ACK."""
+    if len(data) < 240 or data[236:240] != DHCP_MAGIC or data[1] != 1 or data[2] != 6:
+        return []
+    options = _dhcp_options(data[240:])
+    msg_type = options.get(53, b'\0')[0]
+    if data[0] == 1:
+        # Client: angefragte Adresse oder die bereits benutzte
+        if msg_type in (DHCPDECLINE, DHCPRELEASE):
+            return []
+        address = options.get(50) or data[12:16]
+    elif msg_type == DHCPACK:
+        address = data[16:20]
+    else:
+        return []
+    if len(address) != 4 or address == b'\0\0\0\0':
+        return []
+    hostname = options.get(12, b'').decode('utf-8', 'replace').strip('\0') or None
+    return [_observation(socket.inet_ntoa(address), _mac(data[28:34]), 'dhcp', hostname)]
+
+
+def _dns_name(data: bytes, offset: int) -> Tuple[str, int]:
+    labels = []
+    end = None
+    jumps = 0
+    while True:
+        length = data[offset]
+        if length & 0xC0 == 0xC0:
+            # Komprimierter Name: Zeiger auf frühere Stelle
+            if end is None:
+                end = offset + 2
+            jumps += 1
+            if jumps > 32:
+                raise ValueError("DNS name pointer loop")
+            offset = ((length & 0x3F) << 8) | data[offset + 1]
+            continue
+        offset += 1
+        if length == 0:
+            break
+        labels.append(data[offset:offset + length].decode('utf-8', 'replace'))
+        offset += length
+    return '.'.join(labels), end if end is not None else offset
+
+
+def parse_mdns(data: bytes, src_ip: str, mac: Optional[str] = None) -> List[Observation]:
+    """Read hostnames from mDNS A records; the sender itself is always reported."""
+    _, flags, questions, *records = struct.unpack_from('!HHHHHH', data)
+    offset = 12
+    for _ in range(questions):
+        offset = _dns_name(data, offset)[1] + 4
+    names: Dict[str, str] = {}
+    if flags & 0x8000:
+        for _ in range(sum(records)):
+            name, offset = _dns_name(data, offset)
+            rtype, _, _, rdlength = struct.unpack_from('!HHIH', data, offset)
+            offset += 10
+            if rtype == DNS_TYPE_A and rdlength == 4 and name.endswith('.local'):
+                names.setdefault(socket.inet_ntoa(data[offset:offset + 4]), name[:-len('.local')])
+            offset += rdlength
+    observations = [_observation(src_ip, mac, 'mdns', names.pop(src_ip, None))]
+    observations.extend(_observation(ip, None, 'mdns', name) for ip, name in names.items())
+    return observations
+
+
+def parse_ssdp(data: bytes, src_ip: str, mac: Optional[str] = None) -> List[Observation]:
+    """Report the sender of an SSDP announcement, search or answer."""
+    text = data.decode('utf-8', 'replace')
+    start = text.split('\r\n', 1)[0].upper()
+    if not start.startswith(('NOTIFY ', 'M-SEARCH ', 'HTTP/')) or 'SSDP:BYEBYE' in text.upper():
+        return []
+    return [_observation(src_ip, mac, 'ssdp')]
+
+
+def parse_datagram(data: bytes, src_ip: str, src_port: int, dst_port: int,
+                   mac: Optional[str] = None) -> List[Observation]:
+    """Dispatch a UDP payload to the parser for its port; malformed packets give nothing."""
+    try:
+        if dst_port == 67 or src_port == 67:
+            return parse_dhcp(data)
+        if dst_port == 5353 or src_port == 5353:
+            return parse_mdns(data, src_ip, mac)
+        if dst_port == 1900 or src_port == 1900:
+            return parse_ssdp(data, src_ip, mac)
+    except (struct.error, IndexError, ValueError):
+        pass
+    return []
+
+
+def parse_frame(frame: bytes) -> List[Observation]:
+    """Parse an Ethernet frame (ARP or UDP over IPv4) into observations."""
+    if len(frame) < 14:
+        return []
+    src_mac = _mac(frame[6:12])
+    ethertype = struct.unpack_from('!H', frame, 12)[0]
+    payload = frame[14:]
+    if ethertype == ETH_P_8021Q and len(frame) >= 18:
+        ethertype = struct.unpack_from('!H', frame, 16)[0]
+        payload = frame[18:]
+    if ethertype == ETH_P_ARP:
+        # Sender MAC/IP; ARP probes (sender 0.0.0.0) are skipped
+        if len(payload) < 28 or payload[4] != 6 or payload[5] != 4 or payload[14:18] == b'\0\0\0\0':
+            return []
+        return [_observation(socket.inet_ntoa(payload[14:18]), _mac(payload[8:14]), 'arp')]
+    if ethertype != ETH_P_IP or len(payload) < 20 or payload[9] != socket.IPPROTO_UDP:
+        return []
+    header = (payload[0] & 0x0F) * 4
+    if len(payload) < header + 8:
+        return []
+    src_port, dst_port = struct.unpack_from('!HH', payload, header)
+    return parse_datagram(payload[header + 8:], socket.inet_ntoa(payload[12:16]), src_port, dst_port, src_mac)
+
+
+def read_pcap(path: str) -> Iterator[Tuple[float, bytes]]:
+    """Yield (timestamp, Ethernet frame) from a classic pcap file.
+
+    Linux cooked captures (``tcpdump -i any``) are converted to Ethernet
+    frames; pcapng is not supported.
+    """
+    with open(path, 'rb') as f:
+        header = f.read(24)
+        if len(header) < 24 or header[:4] not in PCAP_MAGIC:
+            raise ValueError(f"{path} is not a pcap file (pcapng is not supported)")
+        endian, resolution = PCAP_MAGIC[header[:4]]
+        linktype = struct.unpack(endian + 'I', header[20:24])[0] & 0x0FFFFFFF
+        if linktype not in (LINKTYPE_ETHERNET, LINKTYPE_LINUX_SLL):
+            raise ValueError(f"{path}: unsupported link type {linktype}")
+        record = struct.Struct(endian + 'IIII')
+        while True:
+            data = f.read(record.size)
+            if len(data) < record.size:
+                return
+            seconds, fraction, captured, _ = record.unpack(data)
+            frame = f.read(captured)
+            if linktype == LINKTYPE_LINUX_SLL:
+                if len(frame) < 16:
+                    continue
+                frame = b'\0' * 6 + frame[6:12] + frame[14:16] + frame[16:]
+            yield seconds + fraction / resolution, frame
+
+
+def open_neighbor_socket() -> socket.socket:
+    """Subscribe to neighbor table changes and request a dump of the current table."""
+    sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+    try:
+        sock.bind((0, RTMGRP_NEIGH))
+        sock.setblocking(False)
+        request = NDMSG.pack(socket.AF_INET, 0, 0, 0, 0, 0, 0)
+        sock.send(NLMSG_HEADER.pack(NLMSG_HEADER.size + len(request), RTM_GETNEIGH,
+                                    NLM_F_REQUEST | NLM_F_DUMP, 1, 0) + request)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def open_udp_socket(port: int, group: Optional[str] = None) -> socket.socket:
+    """Listen on a UDP port, joining the multicast ``group`` if given.
+
+    Multicast ports are shared with other listeners (avahi, minissdpd),
+    which get every group packet as well. Without a group the port is
+    bound exclusively: a shared socket could take unicast packets meant
+    for a local DHCP server, so binding fails instead if one runs.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        if group is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if hasattr(socket, 'SO_REUSEPORT'):
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind(('', port))
+        if group is not None:
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP,
+                            socket.inet_aton(group) + socket.inet_aton('0.0.0.0'))
+        sock.setblocking(False)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+class _DatagramListener(asyncio.DatagramProtocol):
+    def __init__(self, discovery: 'PassiveDiscovery', port: int):
+        self.discovery = discovery
+        self.port = port
+
+    def datagram_received(self, data: bytes, addr):
+        for observation in parse_datagram(data, addr[0], addr[1], self.port):
+            self.discovery.observe(observation)
+
+
+class PassiveDiscovery:
+    """Collect observations from the passive sources and report what is new.
+
+    ``on_device`` is called with an observation when an address is seen
+    for the first time, when its MAC or hostname changes and when it was
+    last reported more than ``refresh`` seconds ago. Observations without
+    a MAC (mDNS and SSDP on UDP sockets) take it from earlier observations
+    of the same address. Addresses for which ``accept`` returns False are
+    ignored.
+    """
+
+    def __init__(self, on_device: Callable[[Observation], None], refresh: float = 300.0,
+                 accept: Optional[Callable[[str], bool]] = None):
+        self.on_device = on_device
+        self.refresh = refresh
+        self.accept = accept
+        self.macs: Dict[str, str] = {}
+        self.hostnames: Dict[str, str] = {}
+        self._reported: Dict[str, Tuple[Optional[str], Optional[str], float]] = {}
+        self._neighbor_socket: Optional[socket.socket] = None
+        self._transports: List[asyncio.DatagramTransport] = []
+
+    def observe(self, observation: Observation, now: Optional[float] = None):
+        ip = observation['ip']
+        metrics.passive_observations_total.labels(observation['source']).inc()
+        if self.accept is not None and not self.accept(ip):
+            return
+        if observation.get('mac'):
+            self.macs[ip] = observation['mac']
+        if observation.get('hostname'):
+            self.hostnames[ip] = observation['hostname']
+        mac, hostname = self.macs.get(ip), self.hostnames.get(ip)
+        now = time.monotonic() if now is None else now
+        reported = self._reported.get(ip)
+        if reported is not None and reported[:2] == (mac, hostname) and now - reported[2] < self.refresh:
+            return
+        self._reported[ip] = (mac, hostname, now)
+        logging.debug("Passive observation: %s", observation)
+        try:
+            self.on_device(dict(observation, mac=mac, hostname=hostname))
+        except Exception as e:
+            logging.error(f"Error recording passively found device {ip}: {e}")
+
+    def replay(self, path: str):
+        """Feed a pcap capture through the parsers, using its timestamps."""
+        for timestamp, frame in read_pcap(path):
+            for observation in parse_frame(frame):
+                self.observe(observation, timestamp)
+
+    def _read_neighbors(self):
+        while True:
+            try:
+                data = self._neighbor_socket.recv(65536)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                # ENOBUFS: Änderungen verpasst, der nächste Eintrag kommt trotzdem
+                logging.warning(f"Reading the neighbor table failed: {e}")
+                return
+            for observation in parse_neighbor_messages(data):
+                self.observe(observation)
+
+    async def start(self, sources: Iterable[str] = DEFAULT_SOURCES):
+        """Open the given sources; one that cannot be opened is logged and skipped."""
+        loop = asyncio.get_running_loop()
+        opened = []
+        for source in sources:
+            try:
+                if source == 'neighbors':
+                    self._neighbor_socket = open_neighbor_socket()
+                    loop.add_reader(self._neighbor_socket.fileno(), self._read_neighbors)
+                elif source in LISTENERS:
+                    port, group = LISTENERS[source]
+                    transport, _ = await loop.create_datagram_endpoint(
+                        lambda: _DatagramListener(self, port), sock=open_udp_socket(port, group))
+                    self._transports.append(transport)
+                else:
+                    logging.warning(f"Unknown passive discovery source: {source}")
+                    continue
+                opened.append(source)
+            except (OSError, AttributeError) as e:
+                logging.warning(f"Passive discovery source {source} not available: {e}")
+        logging.info("Passive discovery started", extra={'fields': {'sources': ','.join(opened) or '-'}})
+
+    async def stop(self):
+        if self._neighbor_socket is not None:
+            asyncio.get_running_loop().remove_reader(self._neighbor_socket.fileno())
+            self._neighbor_socket.close()
+            self._neighbor_socket = None
+        for transport in self._transports:
+            transport.close()
+        self._transports = []
+
+
+def _print_observation(observation: Observation):
+    print(json.dumps(observation), flush=True)
+
+
+async def _listen(sources: List[str], refresh: float):
+    discovery = PassiveDiscovery(_print_observation, refresh)
+    await discovery.start(sources)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await discovery.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="HomeNetSupervise passive discovery.")
+    parser.add_argument('--refresh', type=float, default=300.0,
+                        help='Report an unchanged device again after this many seconds (default: 300)')
+    sub = parser.add_subparsers(dest='command', required=True)
+    replay = sub.add_parser('replay', help='Print the devices found in pcap captures')
+    replay.add_argument('captures', nargs='+', help='pcap files (Ethernet or Linux cooked capture)')
+    listen = sub.add_parser('listen', help='Print devices as they are found on the network')
+    listen.add_argument('--sources', default=','.join(DEFAULT_SOURCES),
+                        help=f"Comma separated sources to open, of {','.join(SOURCES)} "
+                             f"(default: {','.join(DEFAULT_SOURCES)})")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    if args.command == 'replay':
+        discovery = PassiveDiscovery(_print_observation, args.refresh)
+        for capture in args.captures:
+            discovery.replay(capture)
+    else:
+        try:
+            asyncio.run(_listen(args.sources.split(','), args.refresh))
+        except KeyboardInterrupt:
+            pass
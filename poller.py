@@ -0,0 +1,114 @@
+import asyncio
+import logging
+import random
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+
+class StatusPoller:
+    """Probe all services in the background and keep the latest snapshot.
+
+    ``probe`` runs one full service check and returns the result list,
+    ``settings`` returns the current ``(interval, jitter)`` pair so config
+    changes take effect on the next cycle without a restart. After every
+    run but the first, ``on_change`` (if given) is called with the results
+    whose state or name changed and the (host, port) keys that disappeared.
+    Results with ``port_open`` None were not checked in time and never
+    count as a change.
+
+    ``version`` counts completed runs; ``up_hosts`` holds the hosts with at
+    least one open service and ``up_version`` changes only when that set does.
+    """
+
+    def __init__(self, probe: Callable[[], Awaitable[List[Dict]]],
+                 settings: Callable[[], Tuple[float, float]],
+                 on_change: Optional[Callable[[List[Dict], List[Tuple[str, int]]], None]] = None):
+        self.probe = probe
+        self.settings = settings
+        self.on_change = on_change
+        self.snapshot: List[Dict] = []
+        self.last_run: Optional[datetime] = None
+        self.version = 0  # counts completed runs
+        self.up_hosts: frozenset = frozenset()
+        self.up_version = 0
+        self._lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def refresh(self) -> List[Dict]:
+        """Re-probe all services now and replace the snapshot.
+
+        Callers arriving while a probe run is in flight wait for that run
+        instead of starting another one.
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        if self._lock.locked():
+            async with self._lock:
+                return self.snapshot
+        async with self._lock:
+            results = await self.probe()
+            checked = datetime.now().isoformat(timespec='seconds')
+            for result in results:
+                result['last_checked'] = checked
+            if self.on_change is not None and self.last_run is not None:
+                self._report_changes(self.snapshot, results)
+            self.snapshot = results
+            self.last_run = datetime.now()
+            self.version += 1
+            # Unknown results (deadline expired) keep the host's previous state
+            up_hosts = frozenset(r['host'] for r in results if r['port_open']
+                                 or (r['port_open'] is None and r['host'] in self.up_hosts))
+            if up_hosts != self.up_hosts:
+                self.up_hosts = up_hosts
+                self.up_version += 1
+            return self.snapshot
+
+    def _report_changes(self, old: List[Dict], new: List[Dict]):
+        previous = {(r['host'], r['port']): r for r in old}
+        current = set()
+        changed = []
+        for result in new:
+            key = (result['host'], result['port'])
+            current.add(key)
+            before = previous.get(key)
+            if result['port_open'] is None:
+                continue  # not checked in time, no transition
+            if before is None or before['port_open'] != result['port_open'] or before['name'] != result['name']:
+                changed.append(result)
+        removed = [key for key in previous if key not in current]
+        if changed or removed:
+            try:
+                self.on_change(changed, removed)
+            except Exception as e:
+                logging.error(f"Error reporting status changes: {e}")
+
+    async def get(self, fresh: bool = False) -> List[Dict]:
+        """Return the cached snapshot, probing first if forced or still empty."""
+        if fresh or self.last_run is None:
+            return await self.refresh()
+        return self.snapshot
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logging.error(f"Error in status poller: {e}")
+            interval, jitter = self.settings()
+            delay = interval * (1 + random.uniform(-jitter, jitter))
+            await asyncio.sleep(max(1.0, delay))
+
+    def start(self):
+        """Start the polling loop on the running event loop."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        """Cancel the polling loop."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,98 @@
+import asyncio
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional, Tuple
+
+
+class ReverseResolver:
+    """Non-blocking reverse DNS lookups with a shared TTL cache.
+
+    Lookups run ``getnameinfo`` in the resolver's own thread pool so a slow
+    resolver never stalls the loop or the default executor; at most
+    ``concurrency`` of them run at once (a lookup that timed out keeps its
+    slot until the thread returns) and concurrent requests for the same IP
+    share one lookup. Failed
+    lookups are cached too (for ``negative_ttl``), so hosts without a PTR
+    record are not asked again on every scan.
+    """
+
+    def __init__(self, ttl: float = 3600, negative_ttl: float = 300,
+                 concurrency: int = 16, timeout: float = 2.0, max_entries: int = 4096):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self._cache: Dict[str, Tuple[str, float]] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._sem: Optional[asyncio.Semaphore] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.version = 0  # changes when a cached name changes
+
+    def peek(self, ip: str) -> Optional[str]:
+        """Return the cached name ("" for no name), or None if not cached."""
+        entry = self._cache.get(ip)
+        if entry is None or entry[1] < time.monotonic():
+            return None
+        return entry[0]
+
+    def _store(self, ip: str, name: str):
+        if len(self._cache) >= self.max_entries:
+            now = time.monotonic()
+            for key in [k for k, (_, expires) in self._cache.items() if expires < now]:
+                del self._cache[key]
+            while len(self._cache) >= self.max_entries:
+                # Oldest entry first
+                del self._cache[next(iter(self._cache))]
+        ttl = self.ttl if name else self.negative_ttl
+        previous = self._cache.get(ip)
+        self._cache[ip] = (name, time.monotonic() + ttl)
+        if previous is None or previous[0] != name:
+            self.version += 1
+
+    def _release(self, future: asyncio.Future):
+        self._sem.release()
+        if not future.cancelled():
+            future.exception()  # retrieved, also after a timeout
+
+    async def _resolve(self, ip: str) -> str:
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.concurrency)
+            self._executor = ThreadPoolExecutor(self.concurrency, thread_name_prefix='resolver')
+        try:
+            await self._sem.acquire()
+            try:
+                future = asyncio.get_running_loop().run_in_executor(
+                    self._executor, socket.getnameinfo, (ip, 0), socket.NI_NAMEREQD)
+            except BaseException:
+                self._sem.release()
+                raise
+            # The slot is freed when the thread returns, not when we stop waiting
+            future.add_done_callback(self._release)
+            name, _ = await asyncio.wait_for(asyncio.shield(future), timeout=self.timeout)
+        except (asyncio.TimeoutError, OSError, ValueError):
+            name = ""
+        finally:
+            self._inflight.pop(ip, None)
+        self._store(ip, name)
+        return name
+
+    async def lookup(self, ip: str) -> str:
+        """Return the host name for an IP, or "" if it has none."""
+        name = self.peek(ip)
+        if name is not None:
+            return name
+        if ip not in self._inflight:
+            self._inflight[ip] = asyncio.ensure_future(self._resolve(ip))
+        return await asyncio.shield(self._inflight[ip])
+
+    def prefetch(self, ips: Iterable[str]):
+        """Start lookups for uncached IPs in the background without waiting."""
+        for ip in ips:
+            if ip and self.peek(ip) is None and ip not in self._inflight:
+                self._inflight[ip] = asyncio.ensure_future(self._resolve(ip))
+
+
+# Shared by autoscan, /devices and /status
+reverse_resolver = ReverseResolver()
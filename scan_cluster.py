@@ -0,0 +1,244 @@
+"""Split large scans into shards and run them in worker processes.
+
+Workers speak a small line-based JSON protocol: the coordinator sends one
+request line ``{"subnet": ..., "ports": [...], "engine": {...},
+"fingerprint": {...}, "known": {...}, "sweep_rate": ..., "token": ...}``
+and the worker answers with one line per finding ``{"progress": 40,
+"result": {...}}`` followed by ``{"done": true}`` or ``{"error": "..."}``.
+Local workers are child processes talking over stdin/stdout; remote
+workers run
+
+    python scan_cluster.py serve --host 0.0.0.0 --port 8765 --token <secret>
+
+on another host and are reached over TCP. A worker listens on loopback
+only by default and refuses any other address without a token.
+"""
+import argparse
+import asyncio
+import hmac
+import ipaddress
+import json
+import logging
+import os
+import sys
+from typing import AsyncGenerator, Dict, List, Optional, Tuple
+
+from scanner import ProbeEngine, autoscan_network
+
+SHARD_PREFIX = 24
+
+
+def split_subnets(subnets: List[str], prefix: int = SHARD_PREFIX) -> List[Tuple[str, int]]:
+    """Split CIDR networks into shards of at most ``/prefix``.
+
+    Returns (shard, host count) pairs; duplicate shards are dropped.
+    """
+    shards = {}
+    for subnet in subnets:
+        network = ipaddress.ip_network(subnet, strict=False)
+        parts = network.subnets(new_prefix=prefix) if network.prefixlen < prefix else [network]
+        for part in parts:
+            hosts = part.num_addresses - 2 if part.prefixlen < 31 else part.num_addresses
+            shards[str(part)] = max(1, hosts)
+    return list(shards.items())
+
+
+async def scan_shard(request: Dict, writer: asyncio.StreamWriter):
+    """Scan one shard and write the protocol lines to ``writer``."""
+    try:
+        engine = ProbeEngine(**request.get('engine', {}))
+        async for progress, result in autoscan_network(
+                request['subnet'], request['ports'], engine, request.get('fingerprint'),
+                request.get('known'), request.get('sweep_rate')):
+            writer.write((json.dumps({"progress": progress, "result": result}) + "\n").encode())
+            await writer.drain()
+        writer.write(b'{"done": true}\n')
+    except Exception as e:
+        writer.write((json.dumps({"error": str(e)}) + "\n").encode())
+    await writer.drain()
+
+
+class ScanCoordinator:
+    """Distribute the shards of a scan over local processes and remote workers.
+
+    Each worker slot takes the next shard from a shared queue, so fast
+    workers get more shards. The socket budget and rate limit of the scan
+    are divided between all slots running at the same time.
+    """
+
+    def __init__(self, processes: Optional[int] = None, remote_workers: Optional[List[str]] = None,
+                 token: Optional[str] = None, shard_prefix: int = SHARD_PREFIX):
+        self.processes = max(1, processes or os.cpu_count() or 1)
+        self.remote_workers = remote_workers or []
+        self.token = token
+        self.shard_prefix = shard_prefix
+
+    async def _open_local(self):
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.abspath(__file__), 'shard',
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            limit=2 ** 20
+        )
+        return process.stdout, process.stdin, process
+
+    async def _open_remote(self, address: str):
+        host, _, port = address.rpartition(':')
+        reader, writer = await asyncio.open_connection(host, int(port), limit=2 ** 20)
+        return reader, writer, None
+
+    async def _run_slot(self, open_worker, shards: asyncio.Queue, events: asyncio.Queue,
+                        request: Dict, remote: bool):
+        while True:
+            try:
+                subnet, hosts = shards.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                reader, writer, process = await open_worker()
+            except OSError as e:
+                if not remote:
+                    raise
+                # Unreachable remote worker: leave its shard to the others
+                logging.error(f"Scan worker unavailable: {e}")
+                shards.put_nowait((subnet, hosts))
+                return
+            try:
+                line = dict(request, subnet=subnet, token=self.token)
+                if request.get('known') is not None:
+                    # Only the known hosts of this shard
+                    network = ipaddress.ip_network(subnet)
+                    line['known'] = {ip: ports for ip, ports in request['known'].items()
+                                     if ipaddress.ip_address(ip) in network}
+                writer.write((json.dumps(line) + "\n").encode())
+                await writer.drain()
+                while True:
+                    raw = await reader.readline()
+                    if not raw:
+                        raise ValueError(f"Scan worker for {subnet} exited unexpectedly")
+                    message = json.loads(raw)
+                    if 'error' in message:
+                        raise ValueError(f"Scan of {subnet} failed: {message['error']}")
+                    if message.get('done'):
+                        break
+                    await events.put((subnet, message['progress'], message['result']))
+            except BaseException:
+                # Do not leave a worker process scanning for nobody
+                if process is not None and process.returncode is None:
+                    process.kill()
+                raise
+            finally:
+                writer.close()
+                if process is not None:
+                    await process.wait()
+            await events.put((subnet, 100, None))
+
+    async def scan(self, subnets: List[str], ports: List[int], engine: Dict,
+                   fingerprint: Optional[Dict] = None, known: Optional[Dict[str, List[int]]] = None,
+                   sweep_rate: Optional[float] = None) -> AsyncGenerator[Tuple[int, Optional[Dict]], None]:
+        """Scan all subnets and yield (progress, result) like ``autoscan_network``.
+
+        ``engine`` holds the ProbeEngine arguments for the whole scan;
+        ``known`` and ``sweep_rate`` make it a delta rescan.
+        """
+        shard_list = split_subnets(subnets, self.shard_prefix)
+        if not shard_list:
+            return
+        total_hosts = sum(hosts for _, hosts in shard_list)
+        shards: asyncio.Queue = asyncio.Queue()
+        for shard in shard_list:
+            shards.put_nowait(shard)
+
+        slots = [(self._open_local, False)] * min(self.processes, len(shard_list))
+        slots += [(lambda address=address: self._open_remote(address), True)
+                  for address in self.remote_workers]
+        share = dict(engine)
+        for key in ('concurrency', 'rate'):
+            if share.get(key):
+                share[key] = max(1, share[key] // len(slots))
+        if sweep_rate:
+            sweep_rate = max(1, sweep_rate // len(slots))
+        request = {"ports": ports, "engine": share, "fingerprint": fingerprint,
+                   "known": known, "sweep_rate": sweep_rate}
+
+        events: asyncio.Queue = asyncio.Queue()
+        hosts_of = dict(shard_list)
+        shard_progress = {subnet: 0 for subnet in hosts_of}
+        workers = [asyncio.ensure_future(self._run_slot(open_worker, shards, events, request, remote))
+                   for open_worker, remote in slots]
+        done = asyncio.ensure_future(asyncio.gather(*workers))
+        try:
+            while True:
+                get = asyncio.ensure_future(events.get())
+                await asyncio.wait([get, done], return_when=asyncio.FIRST_COMPLETED)
+                if not get.done():
+                    get.cancel()
+                    done.result()  # raises if a worker failed
+                    if not events.empty():
+                        continue
+                    if not shards.empty():
+                        raise ValueError("No scan worker left for the remaining subnets")
+                    return
+                subnet, progress, result = get.result()
+                shard_progress[subnet] = progress
+                overall = int(sum(shard_progress[s] * hosts_of[s] for s in hosts_of) / total_hosts)
+                yield overall, result
+        finally:
+            for worker in workers:
+                worker.cancel()
+
+
+async def _serve_stdio():
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    transport, protocol = await loop.connect_write_pipe(asyncio.streams.FlowControlMixin, sys.stdout)
+    writer = asyncio.StreamWriter(transport, protocol, reader, loop)
+    request = json.loads(await reader.readline())
+    await scan_shard(request, writer)
+
+
+async def _serve_tcp(host: str, port: int, token: Optional[str]):
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = json.loads(await reader.readline())
+            sent = str(request.get('token') or '').encode()
+            if token is not None and not hmac.compare_digest(sent, token.encode()):
+                writer.write(b'{"error": "invalid token"}\n')
+            else:
+                await scan_shard(request, writer)
+        except Exception as e:
+            logging.error(f"Scan worker request failed: {e}")
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    logging.info(f"Scan worker listening on {host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="HomeNetSupervise scan worker.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('shard', help='Scan one shard read from stdin (used by the coordinator)')
+    serve = sub.add_parser('serve', help='Accept shards from a coordinator over TCP')
+    serve.add_argument('--host', default='127.0.0.1', help='Address to listen on (default: 127.0.0.1)')
+    serve.add_argument('--port', type=int, default=8765, help='Port to listen on (default: 8765)')
+    serve.add_argument('--token', default=None,
+                       help='Shared secret the coordinator must send (required unless --host is loopback)')
+    args = parser.parse_args()
+    if args.command == 'serve' and args.token is None:
+        try:
+            loopback = ipaddress.ip_address(args.host).is_loopback
+        except ValueError:
+            loopback = args.host == 'localhost'
+        if not loopback:
+            parser.error("--token is required when listening on a non-loopback address")
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    if args.command == 'shard':
+        asyncio.run(_serve_stdio())
+    else:
+        asyncio.run(_serve_tcp(args.host, args.port, args.token))
@@ -0,0 +1,89 @@
+import asyncio
+import json
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+
+class ScanJob:
+    """A running scan and the NDJSON events it has produced so far.
+
+    The scan runs independently of any HTTP connection. Every event gets a
+    sequence number, so a client that lost its connection can resume the
+    stream after the last event it has seen.
+    """
+
+    def __init__(self, scan_id: str):
+        self.id = scan_id
+        self.lines: List[str] = []
+        self.finished_at: Optional[datetime] = None
+        self.task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+
+    @property
+    def done(self) -> bool:
+        return self.finished_at is not None
+
+    def publish(self, event: Dict):
+        """Append an event and wake up all streaming clients."""
+        event['seq'] = len(self.lines)
+        self.lines.append(json.dumps(event) + "\n")
+        self._wakeup.set()
+        self._wakeup = asyncio.Event()
+
+    def finish(self):
+        self.finished_at = datetime.now()
+        self._wakeup.set()
+
+    async def stream(self, after: int = -1) -> AsyncIterator[str]:
+        """Yield all events with a sequence number above ``after``, live until the scan ends."""
+        index = max(0, after + 1)
+        while True:
+            while index < len(self.lines):
+                yield self.lines[index]
+                index += 1
+            if self.done:
+                return
+            await self._wakeup.wait()
+
+
+class ScanRegistry:
+    """Keeps running scans and recently finished ones for resuming."""
+
+    def __init__(self, keep: timedelta = timedelta(minutes=10)):
+        self.keep = keep
+        self.jobs: Dict[str, ScanJob] = {}
+
+    def _prune(self):
+        cutoff = datetime.now() - self.keep
+        for scan_id in [i for i, job in self.jobs.items() if job.done and job.finished_at < cutoff]:
+            del self.jobs[scan_id]
+
+    def start(self, run: Callable[[ScanJob], Awaitable[None]]) -> ScanJob:
+        """Start ``run(job)`` as a background task and return the job."""
+        self._prune()
+        job = ScanJob(uuid.uuid4().hex[:12])
+        self.jobs[job.id] = job
+        job.task = asyncio.ensure_future(self._run(job, run))
+        return job
+
+    @staticmethod
+    async def _run(job: ScanJob, run: Callable[[ScanJob], Awaitable[None]]):
+        try:
+            await run(job)
+        except Exception as e:
+            logging.error(f"Scan {job.id} failed: {e}")
+            job.publish({"type": "error", "error": str(e)})
+        finally:
+            job.finish()
+
+    def get(self, scan_id: str) -> Optional[ScanJob]:
+        return self.jobs.get(scan_id)
+
+    async def stop(self):
+        """Cancel all scans that are still running."""
+        tasks = [job.task for job in self.jobs.values() if job.task and not job.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -4,10 +4,16 @@ from async_lru import alru_cache
 import ipaddress
 import re
 import subprocess
-import socket
+from discovery import sweep_hosts, read_neighbor_table
+from resolver import reverse_resolver
+from fingerprint import probe_service, describe_service
+import metrics
 
 async def ping_host(host: str, timeout: float = 1.0) -> bool:
     """Ping a host and return True if successful."""
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    is_up = False
     try:
         process = await asyncio.create_subprocess_exec(
             'ping', '-c', '1', '-W', '1', host,
@@ -15,54 +21,271 @@ async def ping_host(host: str, timeout: float = 1.0) -> bool:
             stderr=asyncio.subprocess.PIPE
         )
         await asyncio.wait_for(process.communicate(), timeout=timeout)
-        return process.returncode == 0
+        is_up = process.returncode == 0
     except (asyncio.TimeoutError, Exception):
-        return False
+        pass
+    if is_up:
+        # Includes the process start, an upper bound for the RTT
+        metrics.ping_seconds.labels('subprocess').observe(loop.time() - started)
+    metrics.pings_total.labels('subprocess', 'up' if is_up else 'down').inc()
+    return is_up
 
-async def check_port(host: str, port: int, timeout: float = 1.0) -> bool:
-    """Check if a TCP port is open."""
+# Ports probed first during scans, most commonly open first
+COMMON_PORTS = [
+    80, 443, 22, 53, 445, 139, 8080, 3389, 21, 23, 25, 8443, 631, 9100,
+    5000, 8000, 8081, 8888, 3306, 5432, 1433, 27017, 6379, 1883, 554,
+    110, 143, 993, 995, 587, 548, 2049, 111, 5900, 9090, 32400, 8123,
+]
+PORT_PRIORITY = {port: rank for rank, port in enumerate(COMMON_PORTS)}
+
+def port_priority(port: int) -> Tuple[int, int]:
+    """Sort key that puts common ports first, the rest in numeric order."""
+    return PORT_PRIORITY.get(port, len(COMMON_PORTS)), port
+
+async def connect_port(host: str, port: int, timeout: float = 1.0) -> Tuple[bool, Optional[float]]:
+    """Try a TCP connect and return (open, rtt).
+
+    rtt is the time until the host answered, either by accepting or by
+    refusing the connection, and None if it did not answer in time.
+    """
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    result, elapsed = 'cancelled', None
+    metrics.probes_in_flight.inc()
     try:
         reader, writer = await asyncio.wait_for(
             asyncio.open_connection(host, port),
             timeout=timeout
         )
+        result, elapsed = 'open', loop.time() - started
         writer.close()
         await writer.wait_closed()
-        return True
-    except (asyncio.TimeoutError, ConnectionRefusedError, OSError):
-        return False
+        return True, elapsed
+    except ConnectionRefusedError:
+        result, elapsed = 'refused', loop.time() - started
+        return False, elapsed
+    except asyncio.TimeoutError:
+        result = 'timeout'
+        return False, None
+    except OSError:
+        result = 'error'
+        return False, None
+    finally:
+        metrics.probes_in_flight.dec()
+        metrics.probes_total.labels(result).inc()
+        metrics.port_check_seconds.labels(result).observe(
+            elapsed if elapsed is not None else loop.time() - started)
+
+async def check_port(host: str, port: int, timeout: float = 1.0) -> bool:
+    """Check if a TCP port is open."""
+    is_open, _ = await connect_port(host, port, timeout)
+    return is_open
+
+class RateLimiter:
+    """Token bucket limiting how many connection attempts start per second."""
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = rate
+        self.burst = burst or max(1, int(rate / 10))
+        self._tokens = float(self.burst)
+        self._last: Optional[float] = None
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            if self._last is not None:
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+class ProbeEngine:
+    """Run many port checks concurrently.
+
+    A global semaphore bounds the number of open sockets, a per-host
+    semaphore keeps a single host with many ports from starving the others,
+    and an optional deadline caps the wall time of a whole run. The limits
+    are shared by all runs on the same engine, so one engine can serve a
+    whole scan. Optionally new connection attempts are rate limited, and
+    with ``adaptive`` the timeout per host shrinks to what its observed
+    round-trip times suggest (srtt + 4 * rttvar, as TCP does), but never
+    below ``min_timeout`` or above ``timeout``.
+    """
+
+    def __init__(self, concurrency: int = 100, per_host: int = 8,
+                 timeout: float = 1.0, deadline: Optional[float] = None,
+                 rate: Optional[float] = None, adaptive: bool = False,
+                 min_timeout: float = 0.2, prioritize: bool = False):
+        self.concurrency = max(1, int(concurrency))
+        self.per_host = max(1, int(per_host))
+        self.timeout = timeout
+        self.deadline = deadline
+        self.rate = rate
+        self.adaptive = adaptive
+        self.min_timeout = min(min_timeout, timeout)
+        self.prioritize = prioritize
+        self.rtt: Dict[str, Tuple[float, float]] = {}
+        self._global_sem: Optional[asyncio.Semaphore] = None
+        self._host_sems: Dict[str, asyncio.Semaphore] = {}
+        self._limiter: Optional[RateLimiter] = None
+
+    def host_timeout(self, host: str) -> float:
+        """Connect timeout for a host, based on its RTT if adaptive."""
+        if not self.adaptive or host not in self.rtt:
+            return self.timeout
+        srtt, rttvar = self.rtt[host]
+        return max(self.min_timeout, min(self.timeout, srtt + 4 * rttvar))
+
+    def _observe(self, host: str, rtt: float):
+        if host not in self.rtt:
+            self.rtt[host] = (rtt, rtt / 2)
+            return
+        srtt, rttvar = self.rtt[host]
+        rttvar = 0.75 * rttvar + 0.25 * abs(srtt - rtt)
+        srtt = 0.875 * srtt + 0.125 * rtt
+        self.rtt[host] = (srtt, rttvar)
+
+    def _interleave(self, targets: List[Tuple[str, int]]) -> List[Tuple[int, str, int]]:
+        """Order targets round-robin over hosts, keeping their input index."""
+        by_host: Dict[str, List[Tuple[int, str, int]]] = {}
+        for idx, (host, port) in enumerate(targets):
+            by_host.setdefault(host, []).append((idx, host, port))
+        queues = list(by_host.values())
+        if self.prioritize:
+            for queue in queues:
+                queue.sort(key=lambda target: port_priority(target[2]))
+        ordered = []
+        for rank in range(max((len(q) for q in queues), default=0)):
+            for queue in queues:
+                if rank < len(queue):
+                    ordered.append(queue[rank])
+        return ordered
+
+    def _init_limits(self):
+        # Created lazily so they bind to the loop the engine is used on
+        if self._global_sem is None:
+            self._global_sem = asyncio.Semaphore(self.concurrency)
+            if self.rate:
+                self._limiter = RateLimiter(self.rate)
+
+    async def probe(self, host: str, port: int) -> bool:
+        """Check a single port within the engine's limits."""
+        is_open, _ = await self.measure(host, port)
+        return is_open
+
+    async def measure(self, host: str, port: int) -> Tuple[bool, Optional[float]]:
+        """Check a single port within the engine's limits and return (open, rtt)."""
+        if not host or not isinstance(port, int) or not 0 < port <= 65535:
+            return False, None
+        self._init_limits()
+        host_sem = self._host_sems.setdefault(host, asyncio.Semaphore(self.per_host))
+        metrics.probes_waiting.inc()
+        waiting = True
+        try:
+            async with host_sem:
+                async with self._global_sem:
+                    if self._limiter is not None:
+                        await self._limiter.acquire()
+                    metrics.probes_waiting.dec()
+                    waiting = False
+                    is_open, rtt = await connect_port(host, port, self.host_timeout(host))
+        finally:
+            if waiting:
+                metrics.probes_waiting.dec()
+        if rtt is not None:
+            self._observe(host, rtt)
+        return is_open, rtt
 
-async def check_services(services: List[Dict]) -> List[Dict]:
-    """Check the status of multiple services."""
+    async def fingerprint(self, host: str, port: int, max_bytes: int = 256,
+                          read_timeout: float = 0.5) -> Dict:
+        """Run ``probe_service`` on a port within the engine's limits."""
+        self._init_limits()
+        host_sem = self._host_sems.setdefault(host, asyncio.Semaphore(self.per_host))
+        async with host_sem:
+            async with self._global_sem:
+                if self._limiter is not None:
+                    await self._limiter.acquire()
+                return await probe_service(host, port, self.host_timeout(host),
+                                           max_bytes, read_timeout)
+
+    async def run(self, targets: List[Tuple[str, int]]) -> List[bool]:
+        """Probe all (host, port) targets and return the results in input order.
+
+        Targets with an invalid port are reported as closed; probes still
+        pending when the deadline expires as None (unknown).
+        """
+        return [is_open for is_open, _ in await self.run_timed(targets)]
+
+    async def run_timed(self, targets: List[Tuple[str, int]]) -> List[Tuple[Optional[bool], Optional[float]]]:
+        """Like ``run``, but return (open, rtt) pairs as ``connect_port`` does."""
+        results: List[Tuple[Optional[bool], Optional[float]]] = [(False, None)] * len(targets)
+        if not targets:
+            return results
+
+        async def probe(idx: int, host: str, port: int):
+            results[idx] = await self.measure(host, port)
+
+        tasks = []
+        for idx, host, port in self._interleave(targets):
+            if host and isinstance(port, int) and 0 < port <= 65535:
+                # Bleibt None, falls die Deadline vorher abläuft
+                results[idx] = (None, None)
+                tasks.append(asyncio.ensure_future(probe(idx, host, port)))
+        if not tasks:
+            return results
+        done, pending = await asyncio.wait(tasks, timeout=self.deadline)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        return results
+
+async def check_services(services: List[Dict], engine: Optional[ProbeEngine] = None) -> List[Dict]:
+    """Check the status of multiple services concurrently."""
+    engine = engine or ProbeEngine()
+    targets = [(service.get('host', ''), service.get('port', 0)) for service in services]
+    port_results = await engine.run_timed(targets)
     results = []
-    for service in services:
-        name = service.get('name', 'Unknown')
-        host = service.get('host', '')
-        port = service.get('port', 0)
-        port_result = await check_port(host, port) if port > 0 else False
+    for service, (port_result, rtt) in zip(services, port_results):
         results.append({
-            'name': name,
-            'host': host,
-            'port': port,
-            'port_open': port_result
+            'name': service.get('name', 'Unknown'),
+            'host': service.get('host', ''),
+            'port': service.get('port', 0),
+            'port_open': port_result,
+            'latency_ms': round(rtt * 1000, 2) if rtt is not None else None
         })
     return results
 
-async def inspect_target(host: str, ports: List[int]) -> Dict:
-    """Manually inspect a target host and its ports."""
+async def inspect_target(host: str, ports: List[int], engine: Optional[ProbeEngine] = None,
+                         fingerprint: bool = False) -> Dict:
+    """Manually inspect a target host and its ports.
+
+    With ``fingerprint`` every open port is also identified by
+    ``probe_service`` and the results are returned under ``services``.
+    """
     if not host or not ports:
         raise ValueError("Host and ports are required")
-    ping_result = await ping_host(host)
-    port_results = {}
     for port in ports:
         if not isinstance(port, int) or port <= 0 or port > 65535:
             raise ValueError(f"Invalid port number: {port}")
-        port_results[port] = await check_port(host, port)
-    return {
+    engine = engine or ProbeEngine()
+    ping_result, port_open = await asyncio.gather(
+        ping_host(host),
+        engine.run([(host, port) for port in ports])
+    )
+    result = {
         'host': host,
         'ping': ping_result,
-        'ports': port_results
+        'ports': dict(zip(ports, port_open))
     }
+    if fingerprint:
+        open_ports = [port for port, is_open in zip(ports, port_open) if is_open]
+        details = await asyncio.gather(*(engine.fingerprint(host, port) for port in open_ports))
+        result['services'] = dict(zip(open_ports, details))
+    return result
 
 async def get_mac_address(ip: str) -> str:
     """Get MAC address for an IP using arp."""
@@ -84,58 +307,157 @@ async def get_mac_address(ip: str) -> str:
     return "Unknown"
 
 async def get_dns_name(ip: str) -> str:
-    try:
-        return socket.gethostbyaddr(ip)[0]
-    except Exception:
-        return ""
+    """Reverse-resolve an IP without blocking the event loop (cached)."""
+    return await reverse_resolver.lookup(ip)
+
+async def autoscan_network(subnet: str, ports: List[int],
+                           engine: Optional[ProbeEngine] = None,
+                           fingerprint: Optional[Dict] = None,
+                           known: Optional[Dict[str, List[int]]] = None,
+                           sweep_rate: Optional[float] = None) -> AsyncGenerator[Tuple[int, Optional[Dict]], None]:
+    """Scan a subnet for hosts and check ports in parallel.
+
+    Results are yielded as soon as they are found: ``{"type": "device",
+    "device": {...}}`` when a host answers, a service dict for every open
+    port and ``None`` when a host is finished, each with the current
+    progress in percent. All port probes of the scan share ``engine``, so
+    its socket budget and rate limit apply to the scan as a whole.
 
-async def autoscan_network(subnet: str, ports: List[int]) -> AsyncGenerator[Tuple[int, Optional[Dict]], None]:
-    """Scan a subnet for hosts and check ports in parallel."""
+    If ``fingerprint`` is given (``{"max_bytes": ..., "read_timeout": ...}``),
+    each open port is identified with a second, budgeted connection and the
+    service is named after what answers, with latency and banner details
+    attached; closed ports cost nothing extra.
+
+    ``known`` (even an empty dict) turns the scan into a delta rescan: it
+    maps the IPs of known hosts to the ports to re-verify on them. Those
+    hosts are checked first and count as up if they answer the ping or any
+    of their ports is open. The rest of the subnet is swept afterwards at
+    ``sweep_rate`` pings per second, and only hosts found there get the
+    full ``ports`` list.
+    """
     try:
         if not re.match(r'^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}/\d{1,2}$', subnet):
             raise ValueError("Invalid subnet format. Use CIDR notation (e.g., 192.168.1.0/24)")
         network = ipaddress.ip_network(subnet, strict=False)
         hosts = [str(ip) for ip in network.hosts()]
         total_hosts = len(hosts)
-        found_services = []
-        found_devices = []
-
-        async def ping_and_ports(ip):
-            if await ping_host(ip):
-                mac = await get_mac_address(ip)
-                dns = await get_dns_name(ip)
-                found_devices.append({
-                    "alias": f"Unknown Device ({ip})",
-                    "mac": mac,
-                    "ip": ip,
-                    "dns": dns
-                })
-                port_tasks = [check_port(ip, port) for port in ports]
-                port_results = await asyncio.gather(*port_tasks)
-                services = []
-                for port, is_open in zip(ports, port_results):
-                    if is_open:
-                        services.append({
-                            "name": f"Unknown Service ({ip}:{port})",
-                            "host": ip,
-                            "port": port
-                        })
-                return services
-            return []
-
-        tasks = [ping_and_ports(ip) for ip in hosts]
-        for idx, coro in enumerate(asyncio.as_completed(tasks), 1):
-            services = await coro
-            found_services.extend(services)
-            progress = int((idx / total_hosts) * 100)
-            for service in services:
-                yield progress, service
-            if not services:
-                yield progress, None
-
-        # Sortiere Geräte nach IP
-        found_devices.sort(key=lambda d: list(map(int, d['ip'].split('.'))))
-        yield 100, {"type": "devices", "devices": found_devices}
+        engine = engine or ProbeEngine(concurrency=256, rate=500, adaptive=True)
+        ports = sorted(ports, key=port_priority)
+        delta = known is not None
+        known = {ip: sorted(known[ip], key=port_priority) for ip in hosts if ip in known} if delta else {}
+        unknown = [ip for ip in hosts if ip not in known]
+        rate = int(engine.rate or 2000)
+        ping_sem = asyncio.Semaphore(engine.concurrency)
+        events: asyncio.Queue = asyncio.Queue()
+        neighbors: Dict[str, str] = {}
+
+        async def sweep(ips, sweep_at):
+            # One ICMP sweep; None means no permission and each host is
+            # pinged with a subprocess instead
+            found = await sweep_hosts(ips, rate=sweep_at)
+            if found is not None:
+                neighbors.update(read_neighbor_table())
+            return found
+
+        async def probe_port(ip, port, report=True):
+            if await engine.probe(ip, port):
+                service = {
+                    "name": f"Unknown Service ({ip}:{port})",
+                    "host": ip,
+                    "port": port
+                }
+                if fingerprint is not None:
+                    details = await engine.fingerprint(ip, port, **fingerprint)
+                    name = describe_service(details)
+                    if name:
+                        service["name"] = f"{name} ({ip}:{port})"
+                    service["fingerprint"] = details
+                if report:
+                    await events.put(service)
+                return service
+            return None
+
+        async def lookup_mac(ip):
+            # The ping just filled the kernel table; one read serves many hosts
+            if ip not in neighbors:
+                neighbors.update(read_neighbor_table())
+            if ip in neighbors:
+                return neighbors[ip]
+            # No /proc/net/arp: `arp` per host, within the ping budget
+            async with ping_sem:
+                return await get_mac_address(ip)
+
+        async def report_device(ip, swept):
+            mac = neighbors.get(ip, "Unknown") if swept else await lookup_mac(ip)
+            dns = await get_dns_name(ip)
+            await events.put({"type": "device", "device": {
+                "alias": f"Unknown Device ({ip})",
+                "mac": mac,
+                "ip": ip,
+                "dns": dns
+            }})
+
+        async def is_alive(ip, found, limiter=None):
+            if found is not None:
+                return ip in found
+            if limiter is not None:
+                await limiter.acquire()
+            async with ping_sem:
+                return await ping_host(ip)
+
+        async def ping_and_ports(ip, found, limiter=None):
+            try:
+                if await is_alive(ip, found, limiter):
+                    await report_device(ip, found is not None)
+                    await asyncio.gather(*(probe_port(ip, port) for port in ports))
+            finally:
+                await events.put(None)
+
+        async def verify_known(ip, found):
+            try:
+                if await is_alive(ip, found):
+                    await report_device(ip, found is not None)
+                    await asyncio.gather(*(probe_port(ip, port) for port in known[ip]))
+                    return
+                # No answer to the ping, but the host may just block ICMP
+                open_services = [service for service in await asyncio.gather(
+                    *(probe_port(ip, port, report=False) for port in known[ip])) if service]
+                if open_services:
+                    await report_device(ip, found is not None)
+                    for service in open_services:
+                        await events.put(service)
+            finally:
+                await events.put(None)
+
+        async def scan_hosts():
+            try:
+                if delta:
+                    found = await sweep(list(known), rate) if known else set()
+                    verify = [asyncio.ensure_future(verify_known(ip, found)) for ip in known]
+                    # The rest of the address space at the lower sweep rate
+                    slow = int(sweep_rate or rate)
+                    found = await sweep(unknown, slow) if unknown else set()
+                    limiter = RateLimiter(slow) if found is None else None
+                    await asyncio.gather(*verify, *(ping_and_ports(ip, found, limiter) for ip in unknown))
+                else:
+                    found = await sweep(hosts, rate)
+                    await asyncio.gather(*(ping_and_ports(ip, found) for ip in hosts))
+            except Exception as e:
+                await events.put(e)
+
+        task = asyncio.ensure_future(scan_hosts())
+        try:
+            finished = 0
+            while finished < total_hosts:
+                event = await events.get()
+                if isinstance(event, Exception):
+                    raise event
+                if event is None:
+                    finished += 1
+                progress = int((finished / total_hosts) * 100)
+                yield progress, event
+        finally:
+            task.cancel()
 
     except Exception as e:
         raise ValueError(f"Error during network scan: {str(e)}")
@@ -0,0 +1,113 @@
+import asyncio
+import os
+import sys
+
+import pytest
+import yaml
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from config_store import ConfigStore  # noqa: E402
+
+
+def write_config(path, config, mtime_ns=None):
+    with open(path, 'w') as f:
+        yaml.dump(config, f)
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = str(tmp_path / 'config.yaml')
+    write_config(path, {
+        'devices': [{'id': 'd1', 'ip': '10.0.0.1'}, {'id': 'd2', 'ip': '10.0.0.2'}],
+        'services': [{'id': 's1', 'host': '10.0.0.1', 'port': 22}],
+    }, mtime_ns=1_000_000_000)
+    return path
+
+
+def test_reloads_only_when_mtime_changes(path):
+    store = ConfigStore(path)
+    config = store.get()
+    version = store.version
+    assert store.get() is config
+    assert store.version == version
+
+    write_config(path, {'devices': [{'id': 'd3', 'ip': '10.0.0.3'}]}, mtime_ns=2_000_000_000)
+    assert store.get() is not config
+    assert store.version > version
+    assert store.get_device('10.0.0.3')['id'] == 'd3'
+    assert store.get_device('10.0.0.1') is None
+
+
+def test_delayed_flush_replaces_file_atomically(path, monkeypatch):
+    replaced = []
+    real_replace = os.replace
+    monkeypatch.setattr(os, 'replace', lambda src, dst: (replaced.append((src, dst)), real_replace(src, dst)))
+
+    async def main():
+        store = ConfigStore(path, flush_delay=0.05)
+        store.upsert_devices([{'ip': '10.0.0.9'}])
+        # Nothing written yet: the save waits for flush_delay
+        with open(path) as f:
+            assert '10.0.0.9' not in f.read()
+        await asyncio.sleep(0.2)
+        return store
+
+    store = asyncio.run(main())
+    assert len(replaced) == 1
+    tmp_path, target = replaced[0]
+    assert target == path
+    assert os.path.dirname(tmp_path) == os.path.dirname(path)
+    assert not os.path.exists(tmp_path)
+    with open(path) as f:
+        assert [d['ip'] for d in yaml.safe_load(f)['devices']] == ['10.0.0.1', '10.0.0.2', '10.0.0.9']
+    # The store's own write is not mistaken for an outside edit
+    config = store.get()
+    assert store.get() is config
+
+
+def test_upsert_keeps_indexes_in_sync(path):
+    store = ConfigStore(path)
+    added, updated = store.upsert_devices([{'ip': '10.0.0.1', 'name': 'nas'}, {'ip': '10.0.0.5'}])
+    assert [d['ip'] for d in added] == ['10.0.0.5']
+    assert updated == []
+    assert store.devices_by_id[added[0]['id']] is store.get_device('10.0.0.5')
+    assert 'name' not in store.get_device('10.0.0.1')
+
+    added, updated = store.upsert_devices([{'id': 'other', 'ip': '10.0.0.1', 'name': 'nas'}], update=True)
+    assert added == []
+    assert store.get_device('10.0.0.1') == {'id': 'd1', 'ip': '10.0.0.1', 'name': 'nas'}
+
+    added, _ = store.upsert_services([{'host': '10.0.0.1', 'port': 22}, {'host': '10.0.0.1', 'port': 80}])
+    assert [s['port'] for s in added] == [80]
+    assert store.get_service('10.0.0.1', 80) is store.services_by_id[added[0]['id']]
+    assert store.service_counts == {'10.0.0.1': 2}
+
+
+@pytest.mark.parametrize('changes, error', [
+    ({'devices': {'delete': ['d2'], 'update': [{'id': 'missing', 'ip': '10.0.0.7'}]}}, KeyError),
+    ({'devices': {'create': [{'ip': '10.0.0.8'}], 'update': [{'id': 'd2', 'ip': '10.0.0.1'}]}}, ValueError),
+    ({'devices': {'create': [{'ip': '10.0.0.8'}]}, 'services': {'delete': ['missing']}}, KeyError),
+])
+def test_apply_is_all_or_nothing(path, changes, error):
+    store = ConfigStore(path)
+    before = yaml.safe_dump(store.get())
+    version = store.version
+    with pytest.raises(error):
+        store.apply(**changes)
+    assert yaml.safe_dump(store.get()) == before
+    assert store.version == version
+    assert store.get_device('10.0.0.8') is None
+
+
+def test_apply_allows_taking_over_a_deleted_key(path):
+    store = ConfigStore(path)
+    report = store.apply(devices={'delete': ['d1'], 'update': [{'id': 'd2', 'ip': '10.0.0.1'}],
+                                  'create': [{'ip': '10.0.0.2'}, {'ip': '10.0.0.1'}]})
+    assert [d['id'] for d in report['devices']['deleted']] == ['d1']
+    assert [d['ip'] for d in report['devices']['skipped']] == ['10.0.0.1']
+    assert store.get_device('10.0.0.1')['id'] == 'd2'
+    assert store.get_device('10.0.0.2') is report['devices']['created'][0]
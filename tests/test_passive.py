@@ -0,0 +1,29 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from passive import PassiveDiscovery  # noqa: E402
+
+# One ARP reply, DHCP request, mDNS announcement and SSDP NOTIFY
+CAPTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'passive.pcap')
+
+
+def test_replay_reports_every_source():
+    found = []
+    PassiveDiscovery(found.append).replay(CAPTURE)
+    assert found == [
+        {'ip': '192.168.178.20', 'mac': 'b8:27:eb:01:02:03', 'hostname': None, 'source': 'arp'},
+        {'ip': '192.168.178.30', 'mac': 'dc:a6:32:aa:bb:cc', 'hostname': 'octopi', 'source': 'dhcp'},
+        {'ip': '192.168.178.40', 'mac': 'f0:9f:c2:11:22:33', 'hostname': 'printer', 'source': 'mdns'},
+        {'ip': '192.168.178.50', 'mac': '00:11:32:44:55:66', 'hostname': None, 'source': 'ssdp'},
+    ]
+
+
+def test_replay_skips_repeats_and_filtered_addresses():
+    found = []
+    discovery = PassiveDiscovery(found.append, accept=lambda ip: ip != '192.168.178.30')
+    discovery.replay(CAPTURE)
+    discovery.replay(CAPTURE)  # same timestamps, within the refresh interval
+    assert [o['ip'] for o in found] == ['192.168.178.20', '192.168.178.40', '192.168.178.50']